@@ -0,0 +1,149 @@
+import csv
+import os
+import queue
+import threading
+from xml.etree import ElementTree
+
+from archives import open_document, document_name
+
+
+_DONE = object()  # end of the files of an account
+
+
+class Account:
+    """
+    MDLP account of a legal entity: credentials from the personal account, thumbprint of its certificate
+    in CryptoPro store (empty - the first one) and which files it uploads:
+    the files of "directory" and the ones whose sender (subject_id of the xml) is one of "sender_ids"
+    (an account with neither of them takes all the files no other account takes)
+    session, cert and tokens are set when the account is connected
+    """
+    def __init__(self, name, client_id, client_secret, user_id, thumbprint='', directory='', sender_ids=()):
+        self.name = name
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.user_id = user_id
+        self.thumbprint = thumbprint
+        self.directory = os.path.abspath(directory) if directory else ''
+        self.sender_ids = set(sender_ids)
+        self.session = None
+        self.cert = None
+        self.tokens = None
+
+
+def read_accounts(path):
+    """
+    Returns accounts from the csv file with columns:
+    name, client_id, client_secret, user_id, thumbprint, directory, sender_ids (separated with spaces)
+    """
+    with open(path, 'r') as file:
+        return [Account(row['name'], row['client_id'], row['client_secret'], row['user_id'],
+                        row.get('thumbprint') or '', row.get('directory') or '',
+                        (row.get('sender_ids') or '').split())
+                for row in csv.DictReader(file)]
+
+
+def sender_id(path):
+    """
+    Returns the sender of the xml document (text of the first subject_id element, None if there is no one)
+    The file is parsed only up to that element
+    """
+    try:
+        with open_document(path) as file:
+            for _, element in ElementTree.iterparse(file):
+                if element.tag.rpartition('}')[2] == 'subject_id':
+                    return (element.text or '').strip()
+    except (ElementTree.ParseError, OSError):
+        return None
+    return None
+
+
+class Router:
+    """
+    Finds the account of a file: by its directory first, then by the sender of the document,
+    then the account without directory and senders (if there is one)
+    """
+    def __init__(self, accounts):
+        self.accounts = accounts
+        self.by_sender = {sender: account for account in accounts for sender in account.sender_ids}
+        defaults = [account for account in accounts if not account.directory and not account.sender_ids]
+        self.default = defaults[0] if defaults else None
+
+    def route(self, path):
+        """
+        Returns the account of the file (None if no account takes it)
+        """
+        full_path = os.path.abspath(path)
+        for account in self.accounts:
+            if account.directory and os.path.commonpath([account.directory, full_path]) == account.directory:
+                return account
+        if self.by_sender:
+            account = self.by_sender.get(sender_id(path))
+            if account:
+                return account
+        return self.default
+
+
+def upload_for_accounts(accounts, paths, upload, queue_size=20):
+    """
+    Routes the files (paths) to the accounts and uploads them for all the accounts at once, each in its own thread
+    upload(account, paths) - uploads the files of the account, yields the jobs (dicts) like upload_documents
+    Yields the jobs of all the accounts (with "account" key) as they are finished,
+    files no account takes are yielded with the error
+    """
+    router = Router(accounts)
+    inputs = {account.name: queue.Queue(maxsize=queue_size) for account in accounts}
+    results = queue.Queue()
+    stop = threading.Event()
+
+    def account_paths(account):
+        while True:
+            path = inputs[account.name].get()
+            if path is _DONE:
+                return
+            yield path
+
+    def work(account):
+        try:
+            for job in upload(account, account_paths(account)):
+                job['account'] = account.name
+                results.put(job)
+        except Exception as err:
+            # the rest of the files of the account fail with the same error
+            for path in account_paths(account):
+                results.put({'filename': document_name(path), 'path': path, 'account': account.name,
+                             'error': err})
+        finally:
+            results.put(_DONE)
+
+    def feed():
+        try:
+            for path in paths:
+                if stop.is_set():
+                    break
+                account = router.route(path)
+                if account is None:
+                    results.put({'filename': document_name(path), 'path': path, 'account': None,
+                                 'error': ValueError(f"No account for {path}")})
+                    continue
+                inputs[account.name].put(path)
+        finally:
+            for account in accounts:
+                inputs[account.name].put(_DONE)
+
+    threads = [threading.Thread(target=work, args=(account,), name=f"account-{account.name}", daemon=True)
+               for account in accounts]
+    threads.append(threading.Thread(target=feed, name='router', daemon=True))
+    for thread in threads:
+        thread.start()
+
+    running = len(accounts)
+    try:
+        while running:
+            job = results.get()
+            if job is _DONE:
+                running -= 1
+                continue
+            yield job
+    finally:
+        stop.set()
@@ -0,0 +1,174 @@
+import io
+import os
+import posixpath
+import tarfile
+import zipfile
+import zlib
+from fnmatch import fnmatch
+
+
+# errors of reading broken archives (bad headers, wrong checksums, truncated or corrupt compressed data)
+ARCHIVE_ERRORS = (zipfile.BadZipFile, tarfile.TarError, zlib.error, EOFError, OSError)
+UNREAD = '(unread)'   # member name of the failure of the members after the place where the archive is broken
+
+class ArchiveMember(str):
+    """
+    Xml document read from an archive (zip, tar, tar.gz, tar.xz) without extracting it
+    The string is its identity: path of the archive / path of the member (used in the journal, reports, retries),
+    "data" - bytes of the member, read once when the archive is read
+    "error" - the error of reading the member from a broken archive: it is raised instead of returning "data",
+    so the document fails like a file which can't be read
+    """
+    def __new__(cls, archive, name, data, error=None):
+        member = super().__new__(cls, os.path.join(archive, name))
+        member.archive = archive
+        member.name = name
+        member._data = data
+        member.error = error
+        return member
+
+    @property
+    def data(self):
+        if self.error is not None:
+            raise self.error
+        return self._data
+
+    def __reduce__(self):
+        # members are sent to the validating and signing processes
+        return ArchiveMember, (self.archive, self.name, self._data, self.error)
+
+
+def open_document(path):
+    """
+    Returns the binary file object of the xml file or of the archive member
+    """
+    if isinstance(path, ArchiveMember):
+        return io.BytesIO(path.data)
+    return open(path, 'rb')
+
+
+def document_size(path):
+    """
+    Returns the size of the xml file or of the archive member in bytes
+    """
+    if isinstance(path, ArchiveMember):
+        return len(path.data)
+    return os.path.getsize(path)
+
+
+def document_name(path):
+    """
+    Returns the name of the document in reports: the file name or archive name / member path
+    """
+    if isinstance(path, ArchiveMember):
+        return f"{os.path.basename(path.archive)}/{path.name}"
+    return os.path.basename(path)
+
+
+def _normalized(name):
+    # "./docs/1.xml" and "docs/1.xml" are the same member
+    return posixpath.normpath(name).lstrip('/')
+
+
+def _matches(name, include):
+    return any(fnmatch(os.path.basename(name), pattern) for pattern in include)
+
+
+def read_archive(archive, include=('*.xml',), names=None):
+    """
+    Yields the members of the archive matching "include" patterns (or with the paths of "names")
+    as ArchiveMember, in the order they are stored; the archive is read once from the beginning to the end
+    (tar archives as a stream, whatever the compression)
+    A member which can't be read is yielded with its error, the others are read further;
+    if the archive can't be read past some place, the members after it are yielded as one member named UNREAD
+    with the error (or as the members of "names" not read yet), the next reading of UNREAD reads the whole archive
+    """
+    if names is not None and UNREAD in names:
+        names = None
+    read = set()
+
+    def wanted(name):
+        return _normalized(name) in names if names is not None else _matches(name, include)
+
+    def member(name, read_data):
+        read.add(name)
+        try:
+            return ArchiveMember(archive, name, read_data())
+        except ARCHIVE_ERRORS as err:
+            return ArchiveMember(archive, name, b'', err)
+
+    try:
+        if zipfile.is_zipfile(archive):
+            with zipfile.ZipFile(archive) as file:
+                for info in file.infolist():
+                    if not info.is_dir() and wanted(info.filename):
+                        yield member(_normalized(info.filename), lambda: file.read(info))
+            return
+        with tarfile.open(archive, 'r|*') as file:
+            for info in file:
+                if info.isfile() and wanted(info.name):
+                    yield member(_normalized(info.name), lambda: file.extractfile(info).read())
+    except ARCHIVE_ERRORS as err:
+        if names is None:
+            yield ArchiveMember(archive, UNREAD, b'', err)
+        else:
+            for name in sorted(names - read):
+                yield ArchiveMember(archive, name, b'', err)
+
+
+def count_members(archive, include=('*.xml',)):
+    """
+    Returns the number of the members of the archive matching "include" patterns
+    (zip archives are counted by their directory, plain tar archives by their headers, skipping the data),
+    None for compressed tar archives: they would be decompressed twice, to count the members and to read them
+    The members after the place where the archive is broken are counted as one (UNREAD)
+    """
+    count = 0
+    try:
+        if zipfile.is_zipfile(archive):
+            with zipfile.ZipFile(archive) as file:
+                return sum(1 for info in file.infolist() if not info.is_dir() and _matches(info.filename, include))
+        try:
+            file = tarfile.open(archive, 'r:')
+        except tarfile.ReadError:
+            # compressed
+            return None
+        with file:
+            for info in file:
+                if info.isfile() and _matches(info.name, include):
+                    count += 1
+    except ARCHIVE_ERRORS:
+        count += 1
+    return count
+
+
+def split_member(path):
+    """
+    Returns (archive, member path) if the path is the identity of an archive member, None otherwise
+    """
+    archive = path
+    while True:
+        parent = os.path.dirname(archive)
+        if parent == archive:
+            return None
+        archive = parent
+        if os.path.isfile(archive):
+            if zipfile.is_zipfile(archive) or tarfile.is_tarfile(archive):
+                return archive, os.path.relpath(path, archive).replace(os.sep, '/')
+            return None
+
+
+def read_documents(paths):
+    """
+    Yields the xml files of "paths" as they are and the archive members (by their identities) read from the archives,
+    every archive is read once for all its members; members which aren't in the archive anymore are skipped
+    """
+    members = {}
+    for path in paths:
+        member = split_member(path) if not os.path.isfile(path) else None
+        if member is None:
+            yield path
+        else:
+            members.setdefault(member[0], set()).add(member[1])
+    for archive, names in members.items():
+        yield from read_archive(archive, names=names)
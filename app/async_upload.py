@@ -0,0 +1,232 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+_DONE = object()  # end of results
+
+
+class AsyncHTTPSClient:
+    """
+    Minimal asyncio HTTP/1.1 client with a pool of up to "connections" keep-alive connections
+    to one host, which uses "ssl_context" (GOST ciphers, trusted CA's) for https
+    Returns requests.Response objects and raises requests exceptions,
+    so the results are handled the same way as the ones of requests.Session
+    """
+    def __init__(self, base_url, ssl_context, connections=10, connect_timeout=10):
+        parts = urlsplit(base_url)
+        self.https = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.https else 80)
+        self.ssl_context = ssl_context if self.https else None
+        self.connect_timeout = connect_timeout
+        self.idle = []   # connections ready for the next request
+        self.slots = asyncio.Semaphore(connections)
+
+    async def _connect(self):
+        try:
+            return await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=self.ssl_context,
+                                        server_hostname=self.host if self.https else None),
+                self.connect_timeout)
+        except asyncio.TimeoutError:
+            raise requests.exceptions.ConnectTimeout(f"Connection to {self.host} timed out")
+        except OSError as err:
+            raise requests.exceptions.ConnectionError(err)
+
+    @staticmethod
+    async def _read_body(reader, headers):
+        if headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    # trailer headers up to the empty line
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    return b''.join(chunks)
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+        if 'Content-Length' in headers:
+            return await reader.readexactly(int(headers['Content-Length']))
+        return await reader.read()
+
+    async def _exchange(self, connection, url, path, headers, body):
+        reader, writer = connection
+        lines = [f"POST {path} HTTP/1.1", f"Host: {self.host}", f"Content-Length: {len(body)}",
+                 "Connection: keep-alive"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if isinstance(body, bytes):
+            writer.write(body)
+            await writer.drain()
+        else:
+            # streamed body: the next chunk is made when the previous one has been sent,
+            # it is read and encoded in a thread, so the other requests in flight don't wait for the disk
+            loop = asyncio.get_running_loop()
+            chunks = iter(body)
+            while True:
+                chunk = await loop.run_in_executor(None, next, chunks, None)
+                if chunk is None:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by the server")
+        version, status, *reason = status_line.decode('latin-1').split(' ', 2)
+        response_headers = CaseInsensitiveDict()
+        while True:
+            line = (await reader.readline()).decode('latin-1').rstrip('\r\n')
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            response_headers[name.strip()] = value.strip()
+        content = await self._read_body(reader, response_headers)
+
+        response = requests.Response()
+        response.status_code = int(status)
+        response.reason = reason[0].strip() if reason else ''
+        response.headers = response_headers
+        response._content = content
+        response.url = url
+        response.encoding = 'utf-8'
+        keep_alive = version == 'HTTP/1.1' and response_headers.get('Connection', '').lower() != 'close'
+        return response, keep_alive
+
+    async def post(self, url, headers, body):
+        """
+        Sends POST request with "body" (bytes or an iterable of bytes chunks with len()), returns requests.Response
+        """
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else '')
+        async with self.slots:
+            connection = self.idle.pop() if self.idle else await self._connect()
+            try:
+                response, keep_alive = await self._exchange(connection, url, path, headers, body)
+            except (OSError, asyncio.IncompleteReadError, ValueError) as err:
+                connection[1].close()
+                raise requests.exceptions.ConnectionError(err)
+            except BaseException:
+                # cancelled or the streamed body failed: the request is cut off
+                connection[1].close()
+                raise
+            if keep_alive:
+                self.idle.append(connection)
+            else:
+                connection[1].close()
+        return response
+
+    def close(self):
+        while self.idle:
+            self.idle.pop()[1].close()
+
+
+class AsyncUploader:
+    """
+    Uploads documents with up to "window" documents/send requests in flight at once
+    Reading and signing run in a thread pool of "executor_workers" (or in the signing processes they call)
+    """
+    def __init__(self, base_url, ssl_context, window=10, timeout=10, executor_workers=4):
+        self.base_url = base_url
+        self.ssl_context = ssl_context
+        self.window = window
+        self.timeout = timeout
+        self.executor_workers = executor_workers
+
+    def run(self, jobs, prepare, finish, stop=None):
+        """
+        prepare(job) - reads and signs the document, returns (url, headers, body, timeout) or None to skip the job
+                       (body - bytes or an iterable of bytes chunks with len(), timeout - seconds of the request),
+                       or the response if it has uploaded the document itself (large documents);
+                       runs in the thread pool
+        finish(job, response) - checks the response (raises for bad ones)
+        Yields the jobs (with "error" set like in the pipeline) as they are finished; if "jobs" raises,
+        the jobs in flight are finished and the exception is raised here
+        "stop" (threading.Event) cancels the requests in flight, it is also set when the caller stops iterating
+        """
+        stop = stop or threading.Event()
+        results = queue.Queue(maxsize=self.window * 2)
+        errors = []   # the exception of "jobs" iterator
+        thread = threading.Thread(target=lambda: asyncio.run(self._main(jobs, prepare, finish, results, stop, errors)),
+                                  name='async-uploader', daemon=True)
+        thread.start()
+        try:
+            while True:
+                job = results.get()
+                if job is _DONE:
+                    break
+                yield job
+            if errors:
+                raise errors[0]
+        finally:
+            stop.set()
+
+    async def _main(self, jobs, prepare, finish, results, stop, errors):
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=self.executor_workers, thread_name_prefix='async-prepare')
+        client = AsyncHTTPSClient(self.base_url, self.ssl_context, self.window, self.timeout)
+        window = asyncio.Semaphore(self.window)
+        tasks = set()
+        iterator = iter(jobs)
+
+        async def put(job):
+            # the queue is bounded, so results wait while the caller is busy
+            while not stop.is_set():
+                try:
+                    results.put_nowait(job)
+                    return
+                except queue.Full:
+                    await asyncio.sleep(0.05)
+
+        async def upload(job):
+            try:
+                request = await loop.run_in_executor(executor, prepare, job)
+                if request is None:
+                    job['skipped'] = True
+                elif isinstance(request, requests.Response):
+                    job['response'] = request
+                else:
+                    url, headers, body, timeout = request
+                    try:
+                        response = await asyncio.wait_for(client.post(url, headers, body), timeout)
+                    except asyncio.TimeoutError:
+                        raise requests.exceptions.ReadTimeout(f"Request to {url} timed out ({timeout:.0f} s)")
+                    finish(job, response)
+                    job['response'] = response
+            except Exception as err:
+                job['error'] = err
+            finally:
+                window.release()
+            await put(job)
+
+        try:
+            while not stop.is_set():
+                await window.acquire()
+                # the next path can take time to appear (directory watching)
+                try:
+                    job = await loop.run_in_executor(executor, next, iterator, _DONE)
+                except Exception as err:
+                    errors.append(err)
+                    job = _DONE
+                if job is _DONE:
+                    window.release()
+                    break
+                job.setdefault('error', None)
+                task = asyncio.create_task(upload(job))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if stop.is_set():
+                for task in tasks:
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            client.close()
+            executor.shutdown(wait=False)
+            results.put(_DONE)
@@ -0,0 +1,125 @@
+"""
+Cold start check of the loaders: imports their modules in fresh interpreters, in an empty folder,
+and reports the time of the imports and of the whole start; fails (exit code 1) if the median start is longer
+than --max-ms, if an import fails (the folder has no info/info.csv, importing must not need it)
+or if an import has done anything: loaded pycades, started threads, created files
+
+    python bench/cold_start.py --runs 5 --max-ms 500
+"""
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+
+RESULT_MARK = 'COLD_START '   # the line of the child process with its results
+# modules of the loaders and of the tools reusing their functions
+MODULES = ('load_xml', 'load_unloaded', 'check_statuses', 'watch_xml', 'memory_check', 'load_xml_app')
+
+
+def measure_imports():
+    """
+    Runs in the child process: imports MODULES and prints the time of every import and what they have done
+    """
+    sys.path.insert(0, APP_DIR)
+    seconds = {}
+    errors = {}
+    for name in MODULES:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as err:
+            # the window needs tkinter, which isn't installed everywhere
+            if err.name not in ('tkinter', '_tkinter'):
+                errors[name] = f"{type(err).__name__}: {err}"
+            continue
+        except Exception as err:
+            # e.g. a file read at import which isn't there
+            errors[name] = f"{type(err).__name__}: {err}"
+            continue
+        seconds[name] = time.perf_counter() - start
+    result = {'seconds': seconds, 'errors': errors,
+              'pycades': 'pycades' in sys.modules,
+              'threads': [thread.name for thread in threading.enumerate() if thread is not threading.main_thread()],
+              'files': os.listdir('.')}
+    print(RESULT_MARK + json.dumps(result))
+
+
+def cold_start():
+    """
+    Imports MODULES in a new interpreter in an empty folder
+    Returns the results of the child process with "total" - seconds of the whole process (interpreter start included)
+    """
+    with tempfile.TemporaryDirectory(prefix='mdlp-cold-start-') as folder:
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'], cwd=folder,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        total = time.perf_counter() - start
+    for line in process.stdout.splitlines():
+        if line.startswith(RESULT_MARK):
+            return dict(json.loads(line[len(RESULT_MARK):]), total=total)
+    raise RuntimeError(f"Imports failed (exit code {process.returncode}):\n{process.stdout}{process.stderr}")
+
+
+def check(results, max_ms):
+    """
+    Returns the problems of the runs (empty list if there are none)
+    """
+    problems = []
+    last = results[-1]
+    for name, error in last['errors'].items():
+        problems.append(f"import {name} fails: {error}")
+    if last['pycades']:
+        problems.append("pycades (CryptoPro) is loaded at import")
+    if last['threads']:
+        problems.append(f"threads are started at import: {', '.join(last['threads'])}")
+    if last['files']:
+        problems.append(f"files are created at import: {', '.join(last['files'])}")
+    median = statistics.median(result['total'] for result in results) * 1000
+    if max_ms and median > max_ms:
+        problems.append(f"cold start takes {median:.0f} ms, more than {max_ms:.0f} ms")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start check of the MDLP loaders")
+    parser.add_argument('--runs', type=int, default=5, help="fresh interpreters to start")
+    parser.add_argument('--max-ms', type=float, default=0, help="longest median start, milliseconds (0 - no limit)")
+    parser.add_argument('--json', help="file to save the results to")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure_imports()
+        return
+
+    # the first run compiles the modules, the others start as the loaders do
+    cold_start()
+    results = [cold_start() for _ in range(args.runs)]
+    for name in results[-1]['seconds']:
+        median = statistics.median(result['seconds'][name] for result in results) * 1000
+        print(f"import {name:<16}{median:>8.1f} ms")
+    totals = [result['total'] * 1000 for result in results]
+    print(f"cold start: median {statistics.median(totals):.1f} ms, max {max(totals):.1f} ms "
+          f"(interpreter start and imports, {args.runs} runs)")
+
+    problems = check(results, args.max_ms)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'runs': results, 'problems': problems}, file, indent=2)
+    for problem in problems:
+        print(f"FAILED: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import os
+import random
+
+
+DOCUMENT_START = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                  '<documents xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" version="1.38">\n'
+                  '<move_order action_id="415">\n'
+                  '<subject_id>{sender}</subject_id>\n'
+                  '<receiver_id>{receiver}</receiver_id>\n'
+                  '<operation_date>2024-01-15T10:00:00+03:00</operation_date>\n'
+                  '<doc_num>{number}</doc_num>\n'
+                  '<doc_date>15.01.2024</doc_date>\n'
+                  '<turnover_type>1</turnover_type>\n'
+                  '<source>1</source>\n'
+                  '<contract_type>1</contract_type>\n'
+                  '<order_details>\n')
+DOCUMENT_END = '</order_details>\n</move_order>\n</documents>\n'
+UNION = '<union><sgtin>{sgtin}</sgtin><cost>{cost}.00</cost><vat_value>{vat}.00</vat_value></union>\n'
+
+
+def place_id(rng):
+    return ''.join(rng.choice('0123456789abcdef') for _ in range(8)) + '-0000-0000-0000-000000000000'
+
+
+def sgtin(rng):
+    # GTIN (14 digits) and serial number (13 characters)
+    return ''.join(rng.choice('0123456789') for _ in range(14)) + \
+        ''.join(rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ0123456789') for _ in range(13))
+
+
+def document(number, size, rng, sender=None):
+    """
+    Returns the text of a move_order document of about "size" bytes (one sgtin at least)
+    """
+    parts = [DOCUMENT_START.format(sender=sender or place_id(rng), receiver=place_id(rng), number=number)]
+    length = len(parts[0]) + len(DOCUMENT_END)
+    while True:
+        cost = rng.randint(100, 9999)
+        parts.append(UNION.format(sgtin=sgtin(rng), cost=cost, vat=cost // 10))
+        length += len(parts[-1])
+        if length >= size:
+            break
+    parts.append(DOCUMENT_END)
+    return ''.join(parts)
+
+
+def generate_corpus(directory, count, size, seed=0, senders=()):
+    """
+    Writes "count" synthetic xml documents of about "size" bytes into the directory
+    (their senders are taken in turn from "senders" if they are given, random otherwise)
+    Returns the paths of the files
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"doc_{i:06d}.xml")
+        sender = senders[i % len(senders)] if senders else None
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(document(i, size, rng, sender))
+        paths.append(path)
+
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates synthetic MDLP xml documents")
+    parser.add_argument('directory')
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--size', type=int, default=10 * 1024, help="bytes of every document")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--senders', nargs='*', default=(), help="subject_id's of the documents")
+    args = parser.parse_args()
+
+    paths = generate_corpus(args.directory, args.count, args.size, args.seed, args.senders)
+    print(f"{len(paths)} documents are written to {args.directory}")
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,224 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Local stand-in of MDLP API for benchmarks: /api/v1/auth, /api/v1/token, /api/v1/documents/send
+    and the large document flow (/api/v1/documents/send_large, PUT of the file to the link, documents/send_finished)
+    "latency" - seconds every upload request takes, "error_rate" - share of them answered with 500,
+    "throttle_rate" - share of them answered with 429 and Retry-After: "retry_after" seconds,
+    "max_rps" - documents/send requests per second above which 429 is answered (0 - no limit),
+    "token_lifetime" - seconds a token is valid (documents/send with an expired token is answered with 401)
+    The settings can be changed while the server is running
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0, error_rate=0, throttle_rate=0, retry_after=1, max_rps=0,
+                 token_lifetime=1800, seed=None):
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.max_rps = max_rps
+        self.token_lifetime = token_lifetime
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.codes = set()
+        self.tokens = {}   # token -> time it expires
+        self.window = []   # times of documents/send requests of the last second
+        self.large = {}   # document_id of a large document -> its sha256 hash, True when the file is uploaded
+        self.stats = {'auth': 0, 'token': 0, 'send': 0, 'accepted': 0, 'bytes': 0,
+                      'errors': 0, 'throttled': 0, 'expired': 0, 'large': 0}
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/api/v1/"
+
+    def start(self):
+        """
+        Serves requests in a background thread
+        """
+        threading.Thread(target=self.serve_forever, name='mdlp-stand-in', daemon=True).start()
+        return self
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.stats[name] += value
+
+    def auth(self, data):
+        if not all(data.get(key) for key in ('client_id', 'client_secret', 'user_id')):
+            return 400, {'error_description': 'client_id, client_secret and user_id are required'}
+        code = str(uuid.uuid4())
+        with self.lock:
+            self.stats['auth'] += 1
+            self.codes.add(code)
+        return 200, {'code': code}
+
+    def token(self, data):
+        with self.lock:
+            self.stats['token'] += 1
+            if data.get('code') not in self.codes or not data.get('signature'):
+                return 401, {'error_description': 'Invalid code or signature'}
+            self.codes.discard(data['code'])
+            token = str(uuid.uuid4())
+            self.tokens[token] = time.time() + self.token_lifetime
+        # the API reports the life time in minutes
+        return 200, {'token': token, 'life_time': self.token_lifetime / 60}
+
+    def check_request(self, authorization):
+        """
+        Returns (status, json, headers) of the failure of an upload request (expired token, 429, 500) or None
+        """
+        token = authorization[len('token '):] if authorization.startswith('token ') else ''
+        now = time.time()
+        with self.lock:
+            expires_at = self.tokens.get(token)
+            if expires_at is None or expires_at < now:
+                self.stats['expired'] += 1
+                return 401, {'error_description': 'Invalid or expired token'}, {}
+
+            throttled = self.random.random() < self.throttle_rate
+            if self.max_rps:
+                self.window = [t for t in self.window if t > now - 1]
+                if len(self.window) >= self.max_rps:
+                    throttled = True
+                else:
+                    self.window.append(now)
+            if throttled:
+                self.stats['throttled'] += 1
+                return 429, {'error_description': 'Too many requests'}, {'Retry-After': str(self.retry_after)}
+
+            if self.random.random() < self.error_rate:
+                self.stats['errors'] += 1
+                return 500, {'error_description': 'Internal server error'}, {}
+        return None
+
+    def send(self, authorization, body):
+        """
+        Returns (status, json, headers) of documents/send request
+        """
+        self.count('send')
+        self.count('bytes', len(body))
+        if self.latency:
+            time.sleep(self.latency)
+        failure = self.check_request(authorization)
+        if failure:
+            return failure
+
+        try:
+            document = json.loads(body)
+            assert document['document'] and document['sign'] and document['request_id']
+        except (ValueError, KeyError, AssertionError):
+            return 400, {'error_description': 'Invalid document'}, {}
+        self.count('accepted')
+        return 200, {'document_id': str(uuid.uuid4())}, {}
+
+    def send_large(self, authorization, data):
+        failure = self.check_request(authorization)
+        if failure:
+            return failure
+        if not (data.get('document_hash') and data.get('sign') and data.get('request_id')):
+            return 400, {'error_description': 'Invalid document'}, {}
+        document_id = str(uuid.uuid4())
+        with self.lock:
+            self.large[document_id] = data['document_hash']
+        return 200, {'document_id': document_id, 'link': f"{self.base_url}upload/{document_id}"}, {}
+
+    def upload(self, document_id, body):
+        self.count('bytes', len(body))
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            expected = self.large.get(document_id)
+            if expected is None or hashlib.sha256(body).hexdigest() != expected:
+                return 400, {'error_description': 'Unknown document or wrong hash'}, {}
+            self.large[document_id] = True
+        return 200, {}, {}
+
+    def send_finished(self, authorization, data):
+        failure = self.check_request(authorization)
+        if failure:
+            return failure
+        with self.lock:
+            if self.large.pop(data.get('document_id'), None) is not True:
+                return 400, {'error_description': 'The document is not uploaded'}, {}
+            self.stats['large'] += 1
+            self.stats['accepted'] += 1
+        return 200, {}, {}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive connections, like the real API
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, data, headers=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        path = self.path.rstrip('/')
+        if path.endswith('/documents/send'):
+            self.reply(*self.server.send(self.headers.get('Authorization', ''), body))
+            return
+        try:
+            data = json.loads(body or b'{}')
+        except ValueError:
+            self.reply(400, {'error_description': 'Invalid json'})
+            return
+        if path.endswith('/auth'):
+            self.reply(*self.server.auth(data))
+        elif path.endswith('/token'):
+            self.reply(*self.server.token(data))
+        elif path.endswith('/documents/send_large'):
+            self.reply(*self.server.send_large(self.headers.get('Authorization', ''), data))
+        elif path.endswith('/documents/send_finished'):
+            self.reply(*self.server.send_finished(self.headers.get('Authorization', ''), data))
+        else:
+            self.reply(404, {'error_description': 'Not found'})
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.reply(*self.server.upload(self.path.rstrip('/').rpartition('/')[2], body))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in of MDLP API")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0, help="seconds per documents/send request")
+    parser.add_argument('--error-rate', type=float, default=0, help="share of 500 responses")
+    parser.add_argument('--throttle-rate', type=float, default=0, help="share of 429 responses")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After of 429 responses (seconds)")
+    parser.add_argument('--max-rps', type=float, default=0, help="documents/send per second before 429")
+    parser.add_argument('--token-lifetime', type=float, default=1800, help="seconds a token is valid")
+    args = parser.parse_args()
+
+    server = StandInServer(args.port, args.latency, args.error_rate, args.throttle_rate, args.retry_after,
+                           args.max_rps, args.token_lifetime)
+    print(f"Serving {server.base_url} (set it as BASE_URL of load_xml.py)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(server.stats))
+
+
+if __name__ == "__main__":
+
+    main()
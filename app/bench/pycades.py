@@ -0,0 +1,139 @@
+"""
+Fake pycades for benchmarks: the part of CryptoPro pycades API used by the loaders,
+signatures are sha256 digests padded to the size of a CAdES-BES signature
+CPU cost of signing and verification is set by environment variables:
+BENCH_SIGN_MS - milliseconds per signature, BENCH_SIGN_MS_PER_MB - milliseconds per MB of signed data
+(the time is spent hashing, outside of the GIL, like a native library)
+Put the bench folder first into PYTHONPATH to use it instead of the real one
+"""
+import base64
+import hashlib
+import os
+import time
+
+
+SIGN_MS = float(os.environ.get('BENCH_SIGN_MS', '0'))
+SIGN_MS_PER_MB = float(os.environ.get('BENCH_SIGN_MS_PER_MB', '0'))
+SIGNATURE_SIZE = int(os.environ.get('BENCH_SIGNATURE_SIZE', '2500'))   # bytes of a signature
+THUMBPRINT = 'B' * 40
+
+CADESCOM_CONTAINER_STORE = 100
+CAPICOM_MY_STORE = 'My'
+CAPICOM_STORE_OPEN_MAXIMUM_ALLOWED = 2
+CAPICOM_CERTIFICATE_FIND_SHA1_HASH = 0
+CAPICOM_CERTIFICATE_INCLUDE_END_ENTITY_ONLY = 2
+CADESCOM_BASE64_TO_BINARY = 1
+CADESCOM_CADES_BES = 1
+CADESCOM_HASH_ALGORITHM_CP_GOST_3411_2012_256 = 101
+CADESCOM_HASH_ALGORITHM_CP_GOST_3411_2012_512 = 102
+
+_BLOCK = bytes(64 * 1024)
+
+
+def _burn(size):
+    """
+    Keeps the CPU busy for the cost of signing "size" bytes
+    """
+    seconds = (SIGN_MS + SIGN_MS_PER_MB * size / 1024 / 1024) / 1000
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        hashlib.sha256(_BLOCK).digest()
+
+
+def _signature(digest):
+    return base64.b64encode(digest + bytes(max(0, SIGNATURE_SIZE - len(digest)))).decode('ascii')
+
+
+def _digest(signature):
+    return base64.b64decode(signature)[:32]
+
+
+class _Value:
+    def __init__(self, value):
+        self.Value = value
+
+
+class _PublicKey:
+    Algorithm = _Value('1.2.643.7.1.1.1.1')   # GOST R 34.10-2012 256 bit
+
+
+class Certificate:
+    def __init__(self, thumbprint=THUMBPRINT):
+        self.Thumbprint = thumbprint
+        self.SubjectName = 'CN=Benchmark'
+
+    def PublicKey(self):
+        return _PublicKey()
+
+
+class Certificates:
+    def __init__(self, thumbprint=None):
+        self.thumbprint = thumbprint
+        self.Count = 1
+
+    def Find(self, find_type, thumbprint):
+        return Certificates(thumbprint)
+
+    def Item(self, index):
+        return Certificate(self.thumbprint or THUMBPRINT)
+
+
+class Store:
+    def __init__(self):
+        self.Certificates = Certificates()
+
+    def Open(self, *args):
+        pass
+
+    def Close(self):
+        pass
+
+
+class Signer:
+    def __init__(self):
+        self.Certificate = None
+        self.CheckCertificate = False
+        self.Options = 0
+        self.KeyPin = ''
+
+
+class HashedData:
+    def __init__(self):
+        self.Algorithm = CADESCOM_HASH_ALGORITHM_CP_GOST_3411_2012_256
+        self.DataEncoding = CADESCOM_BASE64_TO_BINARY
+        self.size = 0
+        self.hash = hashlib.sha256()
+
+    def Hash(self, data):
+        data = base64.b64decode(data)
+        self.size += len(data)
+        self.hash.update(data)
+
+
+class SignedData:
+    def __init__(self):
+        self.ContentEncoding = CADESCOM_BASE64_TO_BINARY
+        self.Content = ''
+
+    def _content(self):
+        return base64.b64decode(self.Content)
+
+    def SignCades(self, signer, cades_type, detached=False):
+        content = self._content()
+        _burn(len(content))
+        return _signature(hashlib.sha256(content).digest())
+
+    def SignHash(self, hashed_data, signer, cades_type):
+        _burn(hashed_data.size)
+        return _signature(hashed_data.hash.digest())
+
+    def VerifyCades(self, signature, cades_type, detached=False):
+        content = self._content()
+        _burn(len(content))
+        if _digest(signature) != hashlib.sha256(content).digest():
+            raise Exception("The signature doesn't match the content")
+
+    def VerifyHash(self, hashed_data, signature, cades_type):
+        _burn(hashed_data.size)
+        if _digest(signature) != hashed_data.hash.digest():
+            raise Exception("The signature doesn't match the hash")
@@ -0,0 +1,190 @@
+"""
+Offline benchmark of the loaders: uploads a synthetic corpus to the local stand-in of MDLP API
+with the fake signer and reports documents per second, latency of every stage and peak RSS
+Runs on any Linux box, without access to the API and without CryptoPro:
+
+    python bench/run_bench.py --count 500 --size 20000 --latency 0.05 --sign-ms 5
+    python bench/run_bench.py --loader load_unloaded --set ASYNC_UPLOADS=20 --set "VERIFY_MODE='sampled'"
+
+Settings of load_xml.py (global variables) are changed with --set NAME=VALUE (python literal),
+they are passed to the loader in its command line
+"""
+import argparse
+import ast
+import csv
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import generate_corpus
+from mdlp_server import StandInServer
+
+
+RESULT_MARK = 'BENCH_RESULT '   # the line of the loader process with its results
+LOADERS = ('load_xml', 'load_unloaded')
+
+
+def run_loader(loader, settings):
+    """
+    Runs in the loader process (its working directory is the benchmark folder):
+    runs the loader with the settings for the stand-in server (its command line) and prints its results
+    """
+    import requests
+    import load_xml
+
+    overrides = {
+        'BASE_URL': settings['base_url'],
+        'CIPHERS': 'DEFAULT',   # the stand-in server is plain http, GOST ciphers aren't needed
+        'CA': requests.certs.where(),
+        # timings of the stages are kept in memory, without the log and the metrics file
+        'METRICS': {'enabled': True, 'log': '', 'prometheus': '', 'port': 0},
+    }
+    overrides.update(settings['overrides'])
+    argv = ['--xml-dir', 'xml']
+    for name, value in overrides.items():
+        argv += ['--set', f"{name}={value!r}"]
+
+    module = __import__(loader)
+    stdout = sys.stdout
+    start = time.perf_counter()
+    with open(f"{loader}.log", 'w') as log:
+        # the output of the loader goes to the log
+        sys.stdout = log
+        try:
+            module.main(argv)
+        finally:
+            sys.stdout = stdout
+    elapsed = time.perf_counter() - start
+
+    collector = load_xml.get_collector()
+    stages = {name: {'count': stage.count, 'failed': stage.failed, 'seconds': stage.seconds, 'bytes': stage.bytes,
+                     **{f"p{int(q * 100)}": value for q, value in stage.quantiles().items()}}
+              for name, stage in collector.stages.items()}
+    result = {'loader': loader, 'seconds': elapsed, 'counters': collector.counters, 'stages': stages,
+              # kilobytes on Linux; the signing processes are counted separately
+              'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              'children_peak_rss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss}
+    print(RESULT_MARK + json.dumps(result))
+
+
+def start_loader(loader, workdir, settings, env):
+    """
+    Runs the loader in a new process (so its peak RSS is its own) and returns its results
+    """
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-loader', loader,
+                              json.dumps(settings)],
+                             cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    for line in process.stdout.splitlines():
+        if line.startswith(RESULT_MARK):
+            return json.loads(line[len(RESULT_MARK):])
+    raise RuntimeError(f"{loader} failed (exit code {process.returncode}):\n{process.stdout}{process.stderr}")
+
+
+def unloaded_files(workdir):
+    """
+    Returns the number of files the loader reported in unloaded.csv
+    """
+    try:
+        with open(os.path.join(workdir, 'info', 'unloaded.csv'), newline='') as file:
+            return sum(1 for _ in csv.DictReader(file))
+    except OSError:
+        return 0
+
+
+def report(result, server_stats, files):
+    """
+    Returns the text report of the run
+    """
+    counters = result['counters']
+    loaded = counters.get('loaded', 0)
+    lines = [f"{result['loader']}: {loaded} of {files} documents loaded in {result['seconds']:.2f} s, "
+             f"{loaded / result['seconds']:.1f} docs/s",
+             f"failed: {counters.get('failed', 0)}, retried: {counters.get('retried', 0)}, "
+             f"skipped: {counters.get('skipped', 0)}",
+             f"peak RSS: {result['peak_rss_kb'] / 1024:.1f} MB"
+             + (f" (signing processes: {result['children_peak_rss_kb'] / 1024:.1f} MB)"
+                if result['children_peak_rss_kb'] else ''),
+             f"server: {json.dumps(server_stats)}",
+             f"{'stage':<22}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'MB':>10}"]
+    for name, stage in sorted(result['stages'].items()):
+        lines.append(f"{name:<22}{stage['count']:>8}{stage['p50'] * 1000:>10.2f}{stage['p95'] * 1000:>10.2f}"
+                     f"{stage['p99'] * 1000:>10.2f}{stage['bytes'] / 1024 / 1024:>10.2f}")
+    return '\n'.join(lines)
+
+
+def setting(text):
+    name, _, value = text.partition('=')
+    return name.strip(), ast.literal_eval(value.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the MDLP loaders")
+    parser.add_argument('--loader', choices=LOADERS, default='load_xml')
+    parser.add_argument('--count', type=int, default=200, help="documents in the corpus")
+    parser.add_argument('--size', type=int, default=10 * 1024, help="bytes of every document")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds per documents/send request")
+    parser.add_argument('--error-rate', type=float, default=0, help="share of 500 responses")
+    parser.add_argument('--throttle-rate', type=float, default=0, help="share of 429 responses")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After of 429 responses (seconds)")
+    parser.add_argument('--max-rps', type=float, default=0, help="documents/send per second before 429")
+    parser.add_argument('--token-lifetime', type=float, default=1800, help="seconds a token is valid")
+    parser.add_argument('--sign-ms', type=float, default=2, help="CPU milliseconds per signature")
+    parser.add_argument('--sign-ms-per-mb', type=float, default=20, help="CPU milliseconds per MB signed")
+    parser.add_argument('--set', type=setting, action='append', default=[], metavar='NAME=VALUE',
+                        help="setting of load_xml.py")
+    parser.add_argument('--workdir', help="folder of the corpus and the files of the run (temporary by default)")
+    parser.add_argument('--json', help="file to save the results to")
+    parser.add_argument('--run-loader', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_loader:
+        run_loader(args.run_loader[0], json.loads(args.run_loader[1]))
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='mdlp-bench-')
+    os.makedirs(os.path.join(workdir, 'info'), exist_ok=True)
+    with open(os.path.join(workdir, 'info', 'info.csv'), 'w', newline='') as file:
+        file.write('client_id,client_secret,user_id\nbench-client,bench-secret,bench-user\n')
+    files = len(generate_corpus(os.path.join(workdir, 'xml'), args.count, args.size))
+
+    server = StandInServer(latency=args.latency, error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                           retry_after=args.retry_after, max_rps=args.max_rps,
+                           token_lifetime=args.token_lifetime, seed=0).start()
+    # the fake pycades is imported instead of the real one
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([BENCH_DIR, APP_DIR, os.environ.get('PYTHONPATH', '')]),
+               BENCH_SIGN_MS=str(args.sign_ms), BENCH_SIGN_MS_PER_MB=str(args.sign_ms_per_mb))
+    settings = {'base_url': server.base_url, 'overrides': dict(args.set)}
+
+    if args.loader == 'load_unloaded':
+        # the first run fails every file, so all of them are left for load_unloaded.py
+        error_rate = server.error_rate
+        server.error_rate = 1
+        start_loader('load_xml', workdir, dict(settings, overrides=dict(settings['overrides'],
+                                                                        RETRY={'max_attempts': 1, 'base_delay': 0,
+                                                                               'max_delay': 0})), env)
+        server.error_rate = error_rate
+        server.stats = dict.fromkeys(server.stats, 0)
+
+    result = start_loader(args.loader, workdir, settings, env)
+    server.shutdown()
+    result['unloaded'] = unloaded_files(workdir)
+    result['server'] = server.stats
+
+    print(report(result, server.stats, files))
+    print(f"files of the run: {workdir}")
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(result, file, indent=2)
+
+
+if __name__ == "__main__":
+
+    main()
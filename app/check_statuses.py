@@ -0,0 +1,87 @@
+import csv
+import requests
+import sys
+from load_xml import (configure, STATUS_POLLING,
+                      get_accounts, connect_account,
+                      document_status, document_errors,
+                      error_description,
+                      get_journal)
+from reconcile import StatusReconciler, PROCESSED_STATUSES, FAILED_STATUSES
+
+
+STATUS_REPORT = 'info/statuses.csv'  # final statuses of the checked documents and their errors
+
+
+def main(argv=None):
+    # settings of info/config.json, the environment and the command line
+    configure(argv, "Checks processing statuses of the uploaded documents")
+    # accounts of info.csv or ACCOUNTS_PATH file,
+    # every one with its session, private certificate (from CryptoPro certmgr) and token manager
+    accounts = get_accounts()
+    for account in accounts:
+        connect_account(account)
+
+    # session keys(tokens) from the cache or from authentication and authorization requests
+    try:
+        for account in accounts:
+            account.tokens.get()
+    except requests.exceptions.RequestException as err:
+        title, message = error_description(err)
+        print(title)
+        print(message)
+        sys.exit()
+
+    journal = get_journal()
+    # uploaded documents which haven't been processed (according to the upload journal)
+    documents = journal.unconfirmed(PROCESSED_STATUSES + FAILED_STATUSES)
+    print(f"Documents to check: {len(documents)}")
+
+    # every document is checked by the account which has uploaded it
+    # (the first one if that account is gone from ACCOUNTS_PATH file)
+    by_name = {account.name: account for account in accounts}
+    owners = {document['document_id']: by_name.get(document['account'], accounts[0]) for document in documents}
+
+    def fetch_status(document_id):
+        owner = owners[document_id]
+        return document_status(owner.session, owner.tokens, document_id)
+
+    reconciler = StatusReconciler(fetch_status, **STATUS_POLLING)
+    counts = {'processed': 0, 'failed': 0, 'unknown': 0}
+
+    with open(STATUS_REPORT, 'w', newline='') as csvfile:
+        fieldnames = ['filename', 'document_id', 'status', 'error']
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer.writeheader()
+
+        for document, status, error in reconciler.run(documents):
+            if status in FAILED_STATUSES:
+                counts['failed'] += 1
+                # error codes of the rejected document from its ticket
+                owner = owners[document['document_id']]
+                try:
+                    error = document_errors(owner.session, owner.tokens, document['document_id'])
+                except (requests.exceptions.RequestException, ValueError, KeyError) as err:
+                    error = f"Ticket is not available: {error_description(err)[1]}"
+            elif status in PROCESSED_STATUSES:
+                counts['processed'] += 1
+            else:
+                counts['unknown'] += 1
+                error = error_description(error)[1] if error else "Still being processed"
+            if status in PROCESSED_STATUSES + FAILED_STATUSES:
+                journal.confirmed(document['path'], document['hash'], status, error)
+            writer.writerow({'filename': document['path'], 'document_id': document['document_id'],
+                             'status': status, 'error': error})
+            csvfile.flush()
+
+    print(f"Processed: {counts['processed']}, failed: {counts['failed']}, not checked: {counts['unknown']}")
+    print(f"Statuses are saved to {STATUS_REPORT}")
+    for account in accounts:
+        account.tokens.stop()
+    journal.close()
+
+
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,263 @@
+import json
+import os
+import socket
+import threading
+import time
+import zlib
+
+
+class ClaimRegistry:
+    """
+    Coordination of several loaders (hosts) uploading one shared folder: a file is uploaded by the loader
+    which has claimed it, the claims are files of the "folder" subfolder of the directory of the file:
+    - <name>.lease - the file is being uploaded by "worker" until "expires" (renewed in the background
+      every lease_seconds / 3), a lease of a crashed loader expires and the file is claimed again;
+    - <name>.done - the file has been uploaded (with the size and mtime it had), it isn't claimed again
+      until it is changed;
+    - <name>.failed - the upload has failed, the file is claimed again only with "retry_failed"
+    Leases are created with O_EXCL and taken over by an atomic rename, which is undone if the renamed lease
+    isn't the expired one read before, so only one loader gets a file
+    "shard" - (index, count): the loader takes the files whose name hash % count == index first and the others
+    after them (if "take_other_shards"), so loaders don't compete for the same files while all of them work
+    The clocks of the hosts should be synchronized (lease expiry)
+    """
+    def __init__(self, folder='.claims', worker_id='', lease_seconds=300, shard=None, take_other_shards=True,
+                 retry_failed=False):
+        self.folder = folder
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.shard = shard
+        self.take_other_shards = take_other_shards
+        self.retry_failed = retry_failed
+        self.held = {}   # path -> lease file of the files claimed by this loader
+        self.lock = threading.Lock()
+        self.stats = {'claimed': 0, 'taken_over': 0, 'busy': 0, 'done': 0}
+        self.folders = set()   # claim folders which exist
+        self.stop_event = threading.Event()
+        threading.Thread(target=self._renew, name='claims', daemon=True).start()
+
+    def _base(self, path):
+        """
+        Returns the path of the claim files of the file without their extension (the folder is created)
+        Members of an archive are claimed next to the archive: <archive name>!<member path with "!" for "/">
+        """
+        archive = getattr(path, 'archive', None)
+        if archive:
+            directory = os.path.dirname(os.path.abspath(archive))
+            name = os.path.basename(archive) + '!' + path.name.replace('/', '!')
+        else:
+            directory, name = os.path.split(os.path.abspath(path))
+        folder = os.path.join(directory, self.folder)
+        if folder not in self.folders:
+            os.makedirs(folder, exist_ok=True)
+            self.folders.add(folder)
+        return os.path.join(folder, name)
+
+    def _count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def _lease(self):
+        return json.dumps({'worker': self.worker_id, 'expires': time.time() + self.lease_seconds})
+
+    def in_shard(self, path):
+        """
+        Returns True if the file belongs to the shard of this loader (always True without sharding)
+        """
+        if not self.shard:
+            return True
+        index, count = self.shard
+        return zlib.crc32(os.path.basename(path).encode('utf-8')) % count == index
+
+    def _finished(self, base, path):
+        """
+        Returns True if the file has been uploaded (with the same size and mtime) or has failed
+        """
+        if not self.retry_failed and os.path.exists(base + '.failed'):
+            return True
+        try:
+            with open(base + '.done', 'r') as file:
+                done = json.load(file)
+            # an archive member is changed with its archive
+            stat = os.stat(getattr(path, 'archive', path))
+        except (OSError, ValueError):
+            return False
+        return done.get('size') == stat.st_size and done.get('mtime') == stat.st_mtime_ns
+
+    def _create(self, lease_path):
+        try:
+            fd = os.open(lease_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as file:
+            file.write(self._lease())
+        return True
+
+    def _take_over(self, lease_path):
+        """
+        Takes the expired lease of another loader; only one of the loaders trying it at once succeeds
+        """
+        try:
+            with open(lease_path, 'r') as file:
+                text = file.read()
+        except FileNotFoundError:
+            return self._create(lease_path)
+        try:
+            expires = json.loads(text).get('expires', 0)
+        except ValueError:
+            # a lease being written right now (or left unwritten by a crashed loader)
+            try:
+                expires = os.path.getmtime(lease_path) + self.lease_seconds
+            except FileNotFoundError:
+                return False
+        if expires > time.time():
+            return False
+        # rename is atomic: the other loaders fail to rename the same lease
+        expired_path = f"{lease_path}.{self.worker_id}.expired"
+        try:
+            os.rename(lease_path, expired_path)
+        except FileNotFoundError:
+            return False
+        # another loader may have taken the lease over (or its owner renewed it) since it was read:
+        # then the renamed lease isn't the expired one and it is put back
+        try:
+            with open(expired_path, 'r') as file:
+                taken = file.read()
+            if taken != text:
+                self._restore(lease_path, taken)
+                return False
+        finally:
+            os.remove(expired_path)
+        return self._create(lease_path)
+
+    def _restore(self, lease_path, text):
+        """
+        Puts back the lease renamed by mistake, unless a new one has been created in its place
+        """
+        try:
+            fd = os.open(lease_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return
+        with os.fdopen(fd, 'w') as file:
+            file.write(text)
+
+    def claim(self, path):
+        """
+        Returns True if the file is claimed by this loader, False if it is done or claimed by another one
+        """
+        base = self._base(path)
+        if self._finished(base, path):
+            self._count('done')
+            return False
+        lease_path = base + '.lease'
+        if self._create(lease_path):
+            claimed = 'claimed'
+        elif self._take_over(lease_path):
+            claimed = 'taken_over'
+        else:
+            self._count('busy')
+            return False
+        # the other loader may have finished the file between the check and the lease
+        if self._finished(base, path):
+            os.remove(lease_path)
+            self._count('done')
+            return False
+        with self.lock:
+            self.held[path] = lease_path
+            self.stats[claimed] += 1
+        return True
+
+    def claimed(self, paths):
+        """
+        Yields the paths claimed by this loader: the files of its shard first, then the others
+        """
+        others = []
+        for path in paths:
+            if not self.in_shard(path):
+                if self.take_other_shards:
+                    others.append(path)
+                continue
+            if self.claim(path):
+                yield path
+        for path in others:
+            if self.claim(path):
+                yield path
+
+    def finish(self, path, uploaded):
+        """
+        Marks the claimed file as uploaded or failed and removes its lease
+        """
+        with self.lock:
+            lease_path = self.held.pop(path, None)
+        if lease_path is None:
+            return
+        base = lease_path[:-len('.lease')]
+        if uploaded:
+            try:
+                stat = os.stat(getattr(path, 'archive', path))
+                marker = {'worker': self.worker_id, 'finished': time.time(),
+                          'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+            except OSError:
+                # the file has been moved away
+                marker = {'worker': self.worker_id, 'finished': time.time()}
+            self._write(base + '.done', marker)
+            if os.path.exists(base + '.failed'):
+                os.remove(base + '.failed')
+        else:
+            self._write(base + '.failed', {'worker': self.worker_id, 'finished': time.time()})
+        try:
+            os.remove(lease_path)
+        except FileNotFoundError:
+            pass
+
+    def _write(self, path, data):
+        tmp_path = f"{path}.{self.worker_id}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(data, file)
+        os.replace(tmp_path, path)
+
+    def _renew(self):
+        """
+        Extends the leases of the files being uploaded, forgets the ones taken over by other loaders
+        """
+        while not self.stop_event.wait(self.lease_seconds / 3):
+            with self.lock:
+                held = list(self.held.items())
+            for path, lease_path in held:
+                try:
+                    with open(lease_path, 'r') as file:
+                        lease = json.load(file)
+                    if lease.get('worker') != self.worker_id:
+                        raise ValueError("taken over")
+                    # a lease close to its expiry can be being taken over right now, it isn't overwritten
+                    if lease.get('expires', 0) - time.time() < self.lease_seconds / 3:
+                        raise ValueError("expired")
+                    text = self._lease()
+                    tmp_path = f"{lease_path}.{self.worker_id}.tmp"
+                    with open(tmp_path, 'w') as file:
+                        file.write(text)
+                    os.replace(tmp_path, lease_path)
+                    # the lease may have been taken over between the check and the write
+                    with open(lease_path, 'r') as file:
+                        if file.read() != text:
+                            raise ValueError("taken over")
+                except (OSError, ValueError):
+                    with self.lock:
+                        self.held.pop(path, None)
+
+    def close(self):
+        """
+        Stops the renewal and removes the leases of the files which haven't been finished, so others take them
+        """
+        self.stop_event.set()
+        with self.lock:
+            held, self.held = self.held, {}
+        for lease_path in held.values():
+            try:
+                os.remove(lease_path)
+            except FileNotFoundError:
+                pass
+
+    def summary(self):
+        return (f"Claims of {self.worker_id}: {self.stats['claimed']} claimed, {self.stats['taken_over']} taken over "
+                f"from expired leases, {self.stats['busy']} claimed by others, {self.stats['done']} already done")
@@ -0,0 +1,162 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import uuid
+
+
+PENDING = 'pending'
+UPLOADED = 'uploaded'
+FAILED = 'failed'
+
+
+def content_hash(data):
+    """
+    Returns sha256 hex digest of the document bytes
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+class UploadJournal:
+    """
+    SQLite journal (WAL mode) of uploads, keyed by file path + content hash
+    Keeps status, number of attempts, last error, request_id sent and document_id received,
+    the account the file was uploaded by (empty - the default one of info.csv)
+    and the processing status of the uploaded document in MDLP with its errors (doc_status, doc_error)
+    Results are committed in batches of "batch_size" or every "commit_interval" seconds,
+    a new attempt is committed right away, so its request_id is saved before it is sent
+    """
+    def __init__(self, path='info/journal.sqlite3', batch_size=50, commit_interval=1.0):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS uploads ('
+            ' path TEXT NOT NULL,'
+            ' hash TEXT NOT NULL,'
+            ' status TEXT NOT NULL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' error TEXT,'
+            ' request_id TEXT NOT NULL,'
+            ' document_id TEXT,'
+            ' updated REAL NOT NULL,'
+            ' PRIMARY KEY (path, hash))'
+        )
+        # columns added after the first version of the journal
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(uploads)')]
+        for column in ('doc_status', 'doc_error', 'account'):
+            if column not in columns:
+                self.connection.execute(f'ALTER TABLE uploads ADD COLUMN {column} TEXT')
+        self.connection.commit()
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.uncommitted = 0
+        self.last_commit = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _write(self, sql, params, commit=False):
+        """
+        Executes the writing statement, commits when the batch is full or the interval has passed
+        """
+        with self.lock:
+            self.connection.execute(sql, params)
+            self.uncommitted += 1
+            if commit or self.uncommitted >= self.batch_size or \
+                    time.monotonic() - self.last_commit >= self.commit_interval:
+                self._commit()
+
+    def _commit(self):
+        self.connection.commit()
+        self.uncommitted = 0
+        self.last_commit = time.monotonic()
+
+    def status(self, path, digest):
+        """
+        Returns the status of the file with the content hash (None if it is new)
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT status FROM uploads WHERE path = ? AND hash = ?',
+                                          (path, digest)).fetchone()
+        return row[0] if row else None
+
+    def begin(self, path, digest, account=''):
+        """
+        Marks the upload attempt of the file by the account as pending
+        Returns the request_id: the same one as in the previous attempts, so retries stay idempotent
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT request_id FROM uploads WHERE path = ? AND hash = ?',
+                                          (path, digest)).fetchone()
+        request_id = row[0] if row else str(uuid.uuid4())
+        self._write(
+            'INSERT INTO uploads (path, hash, status, attempts, request_id, updated, account) '
+            'VALUES (?, ?, ?, 1, ?, ?, ?) '
+            'ON CONFLICT (path, hash) DO UPDATE SET status = excluded.status, attempts = attempts + 1, '
+            'updated = excluded.updated, account = excluded.account',
+            (path, digest, PENDING, request_id, time.time(), account), commit=True)
+        return request_id
+
+    def uploaded(self, path, digest, document_id=None):
+        """
+        Marks the file as uploaded
+        """
+        self._write('UPDATE uploads SET status = ?, error = NULL, document_id = ?, updated = ? '
+                    'WHERE path = ? AND hash = ?',
+                    (UPLOADED, document_id, time.time(), path, digest))
+
+    def failed(self, path, digest, error, account=''):
+        """
+        Marks the file of the account as failed with the error
+        """
+        self._write(
+            'INSERT INTO uploads (path, hash, status, error, request_id, updated, account) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (path, hash) DO UPDATE SET status = excluded.status, error = excluded.error, '
+            'updated = excluded.updated, account = excluded.account',
+            (path, digest, FAILED, str(error), str(uuid.uuid4()), time.time(), account))
+
+    def unfinished_paths(self):
+        """
+        Returns paths of the files whose last attempt failed or was interrupted
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT path FROM uploads AS u WHERE status != ? '
+                'AND updated = (SELECT MAX(updated) FROM uploads WHERE path = u.path) ORDER BY path',
+                (UPLOADED,)).fetchall()
+        return [row[0] for row in rows]
+
+    def unconfirmed(self, final_statuses):
+        """
+        Returns uploaded documents whose processing status isn't one of "final_statuses" yet:
+        dicts with "path", "hash", "document_id", "account" (empty - the default one)
+        and "status" (the last known one) keys
+        """
+        marks = ', '.join('?' * len(final_statuses))
+        with self.lock:
+            rows = self.connection.execute(
+                f'SELECT path, hash, document_id, account, doc_status FROM uploads WHERE status = ? '
+                f'AND document_id IS NOT NULL AND (doc_status IS NULL OR doc_status NOT IN ({marks})) ORDER BY path',
+                (UPLOADED, *final_statuses)).fetchall()
+        return [{'path': path, 'hash': digest, 'document_id': document_id, 'account': account or '',
+                 'status': doc_status}
+                for path, digest, document_id, account, doc_status in rows]
+
+    def confirmed(self, path, digest, doc_status, doc_error=None):
+        """
+        Saves the processing status of the uploaded document and its errors
+        """
+        self._write('UPDATE uploads SET doc_status = ?, doc_error = ? WHERE path = ? AND hash = ?',
+                    (doc_status, doc_error, path, digest))
+
+    def flush(self):
+        """
+        Commits all the written records
+        """
+        with self.lock:
+            self._commit()
+
+    def close(self):
+        with self.lock:
+            self._commit()
+            self.connection.close()
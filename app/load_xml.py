@@ -5,9 +5,31 @@ import requests
 import json
 import base64
 import uuid
+import threading
 import time
-import pycades
+import mmap
+import functools
+from fnmatch import fnmatch
+from xml.etree import ElementTree
 
+from pipeline import Stage, run_pipeline
+from rate_limit import RateLimiter
+from token_manager import TokenManager
+from verification import SignatureVerifier
+from signing_pool import SigningPool
+from journal import UploadJournal, UPLOADED, content_hash
+from signature_cache import SignatureCache
+from retry import RetryScheduler, AUTH, classify_error
+from accounts import Account, read_accounts, upload_for_accounts
+from claims import ClaimRegistry
+from archives import ArchiveMember, open_document, document_size, document_name, read_archive, count_members
+from validation import DocumentValidator
+from metrics import MetricsCollector
+from scanner import scan_directory, count_files
+from async_upload import AsyncUploader
+from streaming_body import DocumentBody, FileBody, CHUNK_SIZE
+from settings import Settings
+from tls import create_resuming_context, keep_alive_socket_options, CountingHTTPSConnectionPool
 from requests.adapters import HTTPAdapter
 from urllib3.util.ssl_ import create_urllib3_context
 
@@ -18,41 +40,204 @@ BASE_URL = 'https://api.mdlp.crpt.ru/api/v1/'  # Base url for post requests
 CA = 'combined.pem'  # trusted Certificate Authorities (path to .pem file)
 URL = 'https://api.mdlp.crpt.ru'  # API MDLP Url
 
-# Reads into variables client_id, client_secret, user_id from the info.csv file
-with open("info/info.csv", 'r') as file:
-         reader = csv.DictReader(file)
-         row = next(reader)
-         CLIENT_ID = row["client_id"]
-         CLIENT_SECRET = row["client_secret"]
-         USER_ID = row["user_id"]
+# client_id, client_secret, user_id from the personal account (read from INFO_PATH file if they are empty)
+INFO_PATH = 'info/info.csv'
+CLIENT_ID = ''
+CLIENT_SECRET = ''
+USER_ID = ''
+
+# several accounts (legal entities) uploading at once, every one with its own certificate, session, token
+# and requests per second: csv file with columns name, client_id, client_secret, user_id,
+# thumbprint (of the certificate in CryptoPro store), directory and sender_ids (subject_id's of the documents
+# separated with spaces) - files are routed to accounts by them
+ACCOUNTS_PATH = 'info/accounts.csv'
 
 PATH_TO_DIRECTORY_WITH_XML = ''  # path to directory where xml files to sign and send are (insert)
 CERT_PIN = '12345678'  # the PIN code of private certificate (insert)
 
+# self-verification of made signatures: 'always', 'sampled' (the first document and then every
+# VERIFY_SAMPLE_RATE-th one), 'async' (in the background, failures go to unloaded.csv) or 'off'
+VERIFY_MODE = 'always'
+VERIFY_SAMPLE_RATE = 100
+
+# number of processes which sign xml documents, each with its own loaded certificate (0 - sign in the pipeline threads)
+# the signer stage of PIPELINE gets not fewer threads, so all of them are busy
+SIGNING_PROCESSES = 0
+
+# which files of PATH_TO_DIRECTORY_WITH_XML are loaded: glob patterns of names to include and exclude
+# (excluded names also skip subfolders), subfolders are scanned if "recursive",
+# "order": None (as listed by the file system, uploading starts at once), 'name', 'mtime' or 'size'
+SCAN = {'include': ['*.xml'], 'exclude': ['done', 'failed', '.claims'], 'recursive': False, 'order': None}
+
+# archives of the directory whose xml files (SCAN "include") are uploaded without extracting them:
+# the members are read once, straight from the archive; "archive path/member path" is the file in the journal
+# and in the reports ([] - archives are not read)
+ARCHIVE_PATTERNS = ['*.zip', '*.tar', '*.tar.gz', '*.tgz', '*.tar.xz', '*.txz']
+
+# xml files larger than this (bytes) are read through mmap (the ones up to HASH_SIGNING_THRESHOLD are encoded
+# into base64 straight from it, the larger ones are only hashed)
+MMAP_THRESHOLD = 1024 * 1024
+
+# xml files larger than this (bytes) are signed over their GOST R 34.11-2012 hash, which is computed
+# reading the file in chunks, so the document isn't passed to CryptoPro as a whole (None - never)
+HASH_SIGNING_THRESHOLD = 8 * 1024 * 1024
+
+JOURNAL_PATH = 'info/journal.sqlite3'  # journal of uploads: what has been uploaded, what is to be retried
+
+# several loaders (hosts) uploading one shared folder ("enabled"): every file is claimed by one of them
+# through lease files in the "folder" subfolder next to it; the leases of a stopped loader expire after
+# "lease_seconds" and its files are taken by the others; "shard": [index, count] - the loader takes
+# the files of its shard (by name hash) first and the others' after them if "take_other_shards"
+# (give every loader its own index); "worker_id" - name of the loader in the leases (host-pid if empty)
+COORDINATION = {'enabled': False, 'folder': '.claims', 'lease_seconds': 300, 'shard': None,
+                'take_other_shards': True, 'worker_id': ''}
+
+# signatures of unchanged documents are reused by retries and re-runs (None - always sign):
+# up to "max_entries" least recently used signatures, made not more than "max_age_days" ago;
+# only verified signatures are kept (with VERIFY_MODE 'sampled' - the sampled ones, with 'off' - all of them)
+SIGNATURE_CACHE = {'path': 'info/signatures.sqlite3', 'max_entries': 20000, 'max_age_days': 30}
+
+# number of threads and queue depth of every stage of the loading pipeline
+PIPELINE = {
+    'validator': {'workers': 1, 'queue_size': 20},
+    'reader': {'workers': 1, 'queue_size': 20},
+    'signer': {'workers': 1, 'queue_size': 20},
+    'uploader': {'workers': 1, 'queue_size': 20},
+}
+
+# pre-flight check of xml files before they are signed: well-formed, <documents> root element, action_id
+# ("enabled"), in "processes" processes (0 - in the pipeline threads), against the XSD schema
+# of MDLP if "schema" (path to the main .xsd file, needs lxml) is set; invalid files go to unloaded.csv
+VALIDATION = {'enabled': True, 'processes': 0, 'schema': ''}
+
+# number of documents/send requests in flight at once with the asyncio upload engine
+# (0 - upload in the threads of PIPELINE "uploader" stage), and the time limit of one request in seconds
+ASYNC_UPLOADS = 0
+UPLOAD_TIMEOUT = 10
+
+# uploading by the size of xml files (bytes): documents larger than "bulk_threshold" are sent with
+# bulk_processing = true, documents larger than "large_threshold" go through the large document flow of the API
+# (documents/send_large, the file is uploaded to the link received, documents/send_finished), None - never;
+# the time limit of an upload grows with the size: UPLOAD_TIMEOUT plus sending at "min_speed" bytes per second
+LARGE_DOCUMENTS = {'bulk_threshold': 1024 * 1024, 'large_threshold': 10 * 1024 * 1024, 'min_speed': 256 * 1024}
+
+# connections to the API kept open (not fewer than the uploader threads are used)
+# and idle seconds of a connection before TCP keep-alive probes (0 - system default)
+POOL_SIZE = 10
+KEEP_ALIVE = 60
+
+# retries of files within the run after transient errors (timeouts, connection errors, 5xx, 429)
+# and rejected session keys(401): attempts per file, delay before the first retry (doubled for every next one)
+# and the longest delay in seconds
+RETRY = {'max_attempts': 5, 'base_delay': 1, 'max_delay': 60}
+
+# requests per second for every API endpoint: starting "rate" and the ceiling "max_rate"
+# (the rate goes down on 429/503 and Retry-After responses and back up on healthy ones)
+RATE_LIMITS = {
+    'auth': {'rate': 2, 'max_rate': 2},
+    'token': {'rate': 2, 'max_rate': 2},
+    'documents/send': {'rate': 2, 'max_rate': 10},
+    'documents/send_large': {'rate': 1, 'max_rate': 2},
+    'documents/send_finished': {'rate': 1, 'max_rate': 2},
+    'documents/status': {'rate': 2, 'max_rate': 10},
+}
+# timings of the stages of uploading (p50/p95/p99 latency, throughput, bytes), printed at the end if "enabled",
+# json lines log of documents ("log"), Prometheus text metrics file ("prometheus", rewritten every "interval" seconds)
+# and http endpoint http://<host>:<port>/metrics ("port", 0 - no endpoint; "host" '127.0.0.1' - from this machine only,
+# '' - from any host)
+METRICS = {'enabled': False, 'log': 'info/upload_log.jsonl', 'prometheus': 'info/metrics.prom', 'port': 0,
+           'host': '127.0.0.1', 'interval': 10}
+
+# polling of processing statuses of uploaded documents (check_statuses.py): parallel requests,
+# delay before the second poll of a document (multiplied by "backoff" for every next one up to "max_delay")
+# and the time after which documents still being processed are reported as they are (seconds)
+STATUS_POLLING = {'workers': 4, 'first_delay': 2, 'backoff': 1.5, 'max_delay': 60, 'timeout': 3600}
+
+TOKEN_CACHE = 'info/token.json'  # session key(token) shared by all the loaders until it expires
+
+# the settings above are the defaults, overridden by info/config.json (or the file of MDLP_CONFIG variable),
+# by MDLP_<NAME> environment variables and by the command line (--set NAME=VALUE, --xml-dir DIR) of the loaders;
+# they are read at the first use, so importing this module doesn't read files, load CryptoPro or connect anywhere
+SETTINGS = Settings(globals())
+
+
+def apply_settings(values):
+    """
+    Applies the settings overridden in the loader (at the start of its signing and validating processes)
+    """
+    SETTINGS.restore(values)
+
+
+def worker_setup():
+    """
+    Returns the function which gives the worker processes the settings of the loader
+    (config.json, MDLP_ variables and --set are applied in the loader process only)
+    """
+    SETTINGS.load()
+    return functools.partial(apply_settings, SETTINGS.overridden())
+
+
+def configure(argv=None, description=None, extra_args=False):
+    """
+    Loads the settings with the command line arguments ("argv", sys.argv[1:] if it is None)
+    Returns the arguments which aren't settings if "extra_args"
+    """
+    return SETTINGS.parse_args(sys.argv[1:] if argv is None else argv, description, extra_args)
+
 
 # sets GOST cipher
 class GOSTAdapter(HTTPAdapter):
     """
     A TransportAdapter that re-enables 3DES support in Requests.
+    All connections share one SSL context, which resumes TLS sessions on reconnects
+    and counts handshakes and requests per connection (tls_stats)
     """
+    def __init__(self, pool_maxsize=None, keep_alive=None, **kwargs):
+        # set before HTTPAdapter.__init__, which calls init_poolmanager
+        self.ssl_context = create_resuming_context(CIPHERS)
+        # trusted CA's are loaded once for all connections
+        self.ssl_context.load_verify_locations(CA)
+        self.tls_stats = self.ssl_context.stats
+        self.keep_alive = KEEP_ALIVE if keep_alive is None else keep_alive
+        super(GOSTAdapter, self).__init__(pool_maxsize=pool_maxsize or POOL_SIZE, **kwargs)
+
     def init_poolmanager(self, *args, **kwargs):
-        context = create_urllib3_context(ciphers=CIPHERS)
-        kwargs['ssl_context'] = context
-        return super(GOSTAdapter, self).init_poolmanager(*args, **kwargs)
+        kwargs['ssl_context'] = self.ssl_context
+        kwargs['socket_options'] = keep_alive_socket_options(self.keep_alive)
+        super(GOSTAdapter, self).init_poolmanager(*args, **kwargs)
+        # connections which count their requests
+        self.poolmanager.pool_classes_by_scheme = dict(self.poolmanager.pool_classes_by_scheme,
+                                                       https=CountingHTTPSConnectionPool)
 
     def proxy_manager_for(self, *args, **kwargs):
-        context = create_urllib3_context(ciphers=CIPHERS)
-        kwargs['ssl_context'] = context
+        kwargs['ssl_context'] = self.ssl_context
+        kwargs['socket_options'] = keep_alive_socket_options(self.keep_alive)
         return super(GOSTAdapter, self).proxy_manager_for(*args, **kwargs)
 
 
-def create_session():
+def create_ssl_context():
     """
-    Creates session with specified parameters
+    Returns SSL context with GOST cipher and trusted CA's verification (for the asyncio upload engine)
     """
+    context = create_urllib3_context(ciphers=CIPHERS)
+    context.load_verify_locations(CA)
+    context.check_hostname = True
+
+    return context
+
+
+def create_session(account=None):
+    """
+    Creates session with specified parameters for the account (the default account if it is None)
+    The session keeps its account and the rate limiter of its requests
+    """
+    SETTINGS.load()
     s = requests.Session()
-    s.mount(URL, GOSTAdapter())   # sets GOST cipher
+    s.mount(URL, GOSTAdapter(max(POOL_SIZE, PIPELINE['uploader']['workers'])))   # sets GOST cipher
     s.verify = CA   # sets CA verification
+    s.account = account or get_default_account()
+    # every account has its own limits
+    s.rate_limiter = get_rate_limiter() if account is None else RateLimiter(RATE_LIMITS, get_collector())
 
     return s
 
@@ -68,37 +253,49 @@ def authentication_request(session):
     url = BASE_URL + 'auth'
     headers = {'Accept': 'application/json', 'Content-Type': 'application/json'}
     data = {
-        "client_id": CLIENT_ID,   # Accounting System
-        "client_secret": CLIENT_SECRET,  # Accounting System
-        "user_id": USER_ID,   # user's certificate's print 
+        "client_id": session.account.client_id,   # Accounting System
+        "client_secret": session.account.client_secret,  # Accounting System
+        "user_id": session.account.user_id,   # user's certificate's print 
         "auth_type": "SIGNED_CODE"   # for residents
     }
     # authentication post request (with verification using trusted CA's - set with session)
-    response = session.post(url, headers=headers, data=json.dumps(data), timeout=(10, 10))  
+    session.rate_limiter.acquire('auth')
+    with get_collector().measure('auth'):
+        response = session.post(url, headers=headers, data=json.dumps(data), timeout=(10, 10))  
+    session.rate_limiter.update('auth', response)
 
     return response
 
 
-def load_certificate():  
+def load_certificate(thumbprint=''):  
     """
     Loading private certificate from CryptoPro certmgr
+    "thumbprint" - SHA1 thumbprint of the certificate (empty - the first one)
     Returns loaded certificate
     """
+    # CryptoPro library is loaded at the first use, not when the module is imported
+    import pycades
     store = pycades.Store()
     store.Open(pycades.CADESCOM_CONTAINER_STORE, pycades.CAPICOM_MY_STORE, pycades.CAPICOM_STORE_OPEN_MAXIMUM_ALLOWED)
     certs = store.Certificates
+    if thumbprint:
+        certs = certs.Find(pycades.CAPICOM_CERTIFICATE_FIND_SHA1_HASH, thumbprint)
+        assert(certs.Count != 0), f"Certificate {thumbprint} with private key not found"
     assert(certs.Count != 0), "Certificates with private key not found"
     
-    cert = certs.Item(1)  # First item in My store
+    cert = certs.Item(1)  # First item in My store (or the one with the thumbprint)
 
     return cert 
 
 
-def sign_the_code_or_xml_document(cert, code_or_xml_string):
+def create_signer(cert=None, thumbprint=''):
     """
-    Signs the "code_or_xml_string" string with "cert" private certificate
-    Returns detached signature (signed "code_or_xml_string" in base64 format) string
+    Returns the signer object configured with "cert" private certificate
+    (loads the certificate with the thumbprint if it isn't given)
     """
+    import pycades
+    if cert is None:
+        cert = load_certificate(thumbprint)
     # This creates a new signer object, which will be used to sign the data
     signer = pycades.Signer()
     # This sets the certificate for the signer to the provided "cert" certificate
@@ -110,29 +307,304 @@ def sign_the_code_or_xml_document(cert, code_or_xml_string):
     # So as not to enter the cert. pin code many times
     #signer.KeyPin = CERT_PIN
 
-    string_to_sign = code_or_xml_string  
-    b = base64.b64encode(bytes(string_to_sign, 'utf-8'))  # formats string into base64 bites 
-    base64_str = b.decode('utf-8')  # and then to regular string
+    return signer
+
+
+# hash algorithms (names of pycades constants) for the public key algorithms of GOST R 34.10-2012 certificates
+HASH_ALGORITHMS = {
+    '1.2.643.7.1.1.1.1': 'CADESCOM_HASH_ALGORITHM_CP_GOST_3411_2012_256',   # 256 bit key
+    '1.2.643.7.1.1.1.2': 'CADESCOM_HASH_ALGORITHM_CP_GOST_3411_2012_512',   # 512 bit key
+}
+
+
+class HashedDocument:
+    """
+    Xml file which is signed over its hash (the file is read in chunks while hashing, not loaded into memory)
+    "algorithm" - the hash algorithm of the signer's certificate (set at the signing if it is None)
+    """
+    def __init__(self, path, algorithm=None):
+        self.path = path
+        self.algorithm = algorithm
+
+
+def hash_algorithm(cert):
+    """
+    Returns the GOST hash algorithm matching the key of "cert" certificate
+    """
+    import pycades
+    oid = cert.PublicKey().Algorithm.Value
+    assert(oid in HASH_ALGORITHMS), f"Unsupported public key algorithm {oid}"
+
+    return getattr(pycades, HASH_ALGORITHMS[oid])
+
+
+def hash_document(path, algorithm):
+    """
+    Computes the hash of the file with "algorithm", feeding it to CryptoPro chunk by chunk
+    Returns pycades.HashedData object
+    """
+    import pycades
+    hashedData = pycades.HashedData()
+    hashedData.Algorithm = algorithm
+    # chunks are passed in base64 (their sizes are multiples of 3, so they are encoded without padding)
+    hashedData.DataEncoding = pycades.CADESCOM_BASE64_TO_BINARY
+    with open_document(path) as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            hashedData.Hash(base64.b64encode(chunk).decode('ascii'))
+
+    return hashedData
 
+
+def sign_base64(signer, base64_str):
+    """
+    Signs "base64_str" data with the signer
+    Returns detached signature in base64 format (with "\n")
+    """
+    import pycades
     # This creates a new signed data object, which will be used to store the signed data
     signedData = pycades.SignedData()
     # Indicates that the content is base64-encoded 
     signedData.ContentEncoding = pycades.CADESCOM_BASE64_TO_BINARY
     signedData.Content = base64_str  # data to sign in base64
     # This signs the data using the specified signer and signature format (True - detached signature)
-    signature = signedData.SignCades(signer, pycades.CADESCOM_CADES_BES, True)
+    return signedData.SignCades(signer, pycades.CADESCOM_CADES_BES, True)
+
+
+def sign_document(signer, document):
+    """
+    Signs the document: base64 string or HashedDocument (signed over its hash, the signature is detached as well)
+    Returns detached signature in base64 format (with "\n")
+    """
+    if not isinstance(document, HashedDocument):
+        return sign_base64(signer, document)
+
+    import pycades
+    if document.algorithm is None:
+        document.algorithm = hash_algorithm(signer.Certificate)
+    hashedData = hash_document(document.path, document.algorithm)
+    signedData = pycades.SignedData()
+    return signedData.SignHash(hashedData, signer, pycades.CADESCOM_CADES_BES)
+
+
+def sign_the_code_or_xml_document(cert, code_or_xml_string, name=None):
+    """
+    Signs the "code_or_xml_string" string with "cert" private certificate
+    The signature is verified according to VERIFY_MODE, "name" - the name of the signed file (None for codes)
+    Returns detached signature (signed "code_or_xml_string" in base64 format) string
+    """
+    string_to_sign = code_or_xml_string  
+    b = base64.b64encode(bytes(string_to_sign, 'utf-8'))  # formats string into base64 bites 
+    base64_str = b.decode('utf-8')  # and then to regular string
+
+    return sign_the_document(cert, base64_str, name)
+
+
+def sign_the_document(cert, document, name=None, on_valid=None, on_invalid=None):
+    """
+    Signs the document with "cert" private certificate: the data already encoded into base64 string
+    (the same string is then sent, so the document isn't encoded twice) or HashedDocument
+    The signature is verified according to VERIFY_MODE, "name" - the name of the signed file (None for codes),
+    "on_valid"(signature) is called when the signature has been verified, "on_invalid"(error) - when its background
+    verification fails
+    Returns detached signature in base64 format string
+    """
+    signer = create_signer(cert)
+
+    start = time.perf_counter()
+    signature = sign_document(signer, document)
     final_signature = ''.join(signature.splitlines())  # \n delition
+    verifier = get_verifier()
+    verifier.add_signing(time.perf_counter() - start)
 
+    # Signature verification (now, later in the background or not at all)
+    verifier.check(document, signature, name, on_valid, on_invalid)
+    
+    return final_signature
+
+
+def verify_signature(document, signature):
+    """
+    Verifies detached "signature" of the document (base64 string or HashedDocument), raises if it is invalid
+    """
+    import pycades
     # This creates another new signed data object, which will be used to verify the signature
     _signedData = pycades.SignedData()
+    if isinstance(document, HashedDocument):
+        # the hash is computed again
+        _signedData.VerifyHash(hash_document(document.path, document.algorithm), signature, pycades.CADESCOM_CADES_BES)
+        return
     _signedData.ContentEncoding = pycades.CADESCOM_BASE64_TO_BINARY
-    _signedData.Content = signedData.Content
+    _signedData.Content = document
     # Signature verification
     _signedData.VerifyCades(signature, pycades.CADESCOM_CADES_BES, True)
-    
-    return final_signature
+
+
+_report_lock = threading.Lock()
+
+
+def report_error(filename, error):
+    """
+    Writes the name of the file which hasn't been loaded successfully and the error to unloaded.csv
+    """
+    with _report_lock, open('info/unloaded.csv', 'a', newline='') as csvfile:
+        fieldnames = ['filename', 'error']
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer.writerow({'filename': filename, 'error': error})
+
+
+_signing_pools = {}
+# the pools, the journal, the cache and the other shared objects are made once by all the accounts
+# (reentrant: some of them are made of the others)
+_resources_lock = threading.RLock()
+
+
+_default_account = None
+
+
+def get_default_account():
+    """
+    Returns the account of CLIENT_ID, CLIENT_SECRET, USER_ID (or of INFO_PATH file) with the first certificate
+    of the store (used if there is no ACCOUNTS_PATH file), read at the first call
+    """
+    global _default_account
+    SETTINGS.load()
+    with _resources_lock:
+        if _default_account is None:
+            credentials = {'client_id': CLIENT_ID, 'client_secret': CLIENT_SECRET, 'user_id': USER_ID}
+            if not all(credentials.values()):
+                # Reads client_id, client_secret, user_id from the info.csv file
+                with open(INFO_PATH, 'r') as file:
+                    row = next(csv.DictReader(file))
+                credentials = {key: value or row[key] for key, value in credentials.items()}
+            _default_account = Account('', credentials['client_id'], credentials['client_secret'],
+                                       credentials['user_id'])
+        return _default_account
+
+
+_collector = None
+
+
+def get_collector():
+    """
+    Returns the collector of METRICS all the timing hooks report to (created at the first call)
+    """
+    global _collector
+    SETTINGS.load()
+    with _resources_lock:
+        if _collector is None:
+            _collector = MetricsCollector(**METRICS)
+        return _collector
+
+
+_rate_limiter = None
+
+
+def get_rate_limiter():
+    """
+    Returns the limiter of RATE_LIMITS all API requests of the default account go through (created at the first call)
+    """
+    global _rate_limiter
+    with _resources_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(RATE_LIMITS, get_collector())
+        return _rate_limiter
+
+
+_verifier = None
+
+
+def get_verifier():
+    """
+    Returns the verifier of made signatures according to VERIFY_MODE (created at the first call)
+    """
+    global _verifier
+    with _resources_lock:
+        if _verifier is None:
+            _verifier = SignatureVerifier(verify_signature, VERIFY_MODE, VERIFY_SAMPLE_RATE, on_failure=report_error,
+                                          metrics=get_collector())
+        return _verifier
+
+
+def get_signing_pool(thumbprint=''):
+    """
+    Returns the pool of SIGNING_PROCESSES signing processes with the certificate (started at the first call),
+    None if it is 0
+    """
+    with _resources_lock:
+        if SIGNING_PROCESSES and thumbprint not in _signing_pools:
+            _signing_pools[thumbprint] = SigningPool(SIGNING_PROCESSES,
+                                                     functools.partial(create_signer, thumbprint=thumbprint),
+                                                     sign_document, verify_signature, get_verifier(),
+                                                     worker_setup())
+        return _signing_pools.get(thumbprint)
+
+
+_journal = None
+
+
+_validator = None
+
+
+def get_validator():
+    """
+    Returns the validator of xml files (started at the first call), None if VALIDATION is off
+    """
+    global _validator
+    with _resources_lock:
+        if VALIDATION['enabled'] and _validator is None:
+            _validator = DocumentValidator(VALIDATION['processes'], VALIDATION['schema'], worker_setup())
+        return _validator
+
+
+def get_journal():
+    """
+    Returns the upload journal (opened at the first call)
+    """
+    global _journal
+    with _resources_lock:
+        if _journal is None:
+            _journal = UploadJournal(JOURNAL_PATH)
+        return _journal
   
 
+_claims = None
+
+
+def get_claims():
+    """
+    Returns the registry of claimed files (created at the first call), None if COORDINATION is off
+    """
+    global _claims
+    with _resources_lock:
+        if COORDINATION['enabled'] and _claims is None:
+            _claims = ClaimRegistry(COORDINATION['folder'], COORDINATION['worker_id'], COORDINATION['lease_seconds'],
+                                    COORDINATION['shard'], COORDINATION['take_other_shards'])
+        return _claims
+
+
+_signature_cache = None
+
+
+def get_signature_cache():
+    """
+    Returns the signature cache (opened at the first call), None if SIGNATURE_CACHE is None
+    """
+    global _signature_cache
+    with _resources_lock:
+        if SIGNATURE_CACHE and _signature_cache is None:
+            _signature_cache = SignatureCache(SIGNATURE_CACHE['path'], SIGNATURE_CACHE['max_entries'],
+                                              SIGNATURE_CACHE['max_age_days'] * 24 * 3600)
+        return _signature_cache
+
+
+def signing_options(document):
+    """
+    Returns the string of the options the document is signed with (part of the signature cache key)
+    """
+    content = 'hash' if isinstance(document, HashedDocument) else 'content'
+    return f"CAdES-BES;detached;end_entity_only;{content}"
+
+
 def authorization_request(session, code, code_signature):
     """
     Makes authorization request to the https://mdlp.crpt.ru website, using code(recieved from authentication request) and signed code
@@ -149,86 +621,594 @@ def authorization_request(session, code, code_signature):
         "signature": code_signature   
     }
 
-    response = session.post(url, headers=headers, data=json.dumps(data), timeout=(10, 10))
+    session.rate_limiter.acquire('token')
+    with get_collector().measure('token'):
+        response = session.post(url, headers=headers, data=json.dumps(data), timeout=(10, 10))
+    session.rate_limiter.update('token', response)
 
     return response
 
 
-def xml_file_convertation(xml_file):
+def xml_file_convertation(xml_file, algorithm=None):
+    """
+    xml_file arg: file name or path to xml file (or ArchiveMember, which is in memory already)
+    Reads the file once as bytes (through mmap if it is larger than MMAP_THRESHOLD),
+    so exactly the bytes on disk are signed and sent
+    Returns sha256 digest of the file and the document to sign: the string of xml file in base64 format
+    or HashedDocument if the file is larger than HASH_SIGNING_THRESHOLD ("algorithm" - its hash algorithm)
+    """
+    if isinstance(xml_file, ArchiveMember):
+        with get_collector().measure('read', len(xml_file.data)):
+            digest = content_hash(xml_file.data)
+            if HASH_SIGNING_THRESHOLD is not None and len(xml_file.data) > HASH_SIGNING_THRESHOLD:
+                document = HashedDocument(xml_file, algorithm)
+            else:
+                with get_collector().measure('base64', len(xml_file.data)):
+                    document = base64.b64encode(xml_file.data).decode('ascii')
+        return digest, document
+
+    # "read" stage is the whole conversion, "base64" - the encoding in it
+    with get_collector().measure('read') as timer, open(xml_file, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        timer.size = size
+        if HASH_SIGNING_THRESHOLD is not None and size > HASH_SIGNING_THRESHOLD:
+            # only the digest is computed here, the file is read again in chunks while it is hashed and sent
+            document = HashedDocument(xml_file, algorithm)
+            if size > MMAP_THRESHOLD:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    digest = content_hash(data)
+            else:
+                digest = content_hash(file.read())
+        elif size > MMAP_THRESHOLD:
+            # the file is hashed and encoded straight from the page cache, without a copy in memory
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                digest = content_hash(data)
+                with get_collector().measure('base64', size):
+                    document = base64.b64encode(data).decode('ascii')
+        else:
+            data = file.read()
+            digest = content_hash(data)
+            with get_collector().measure('base64', size):
+                document = base64.b64encode(data).decode('ascii')
+
+    return digest, document
+
+
+def document_upload_headers(token):
+    """
+    Returns headers of documents/send request with the session key(token)
+    """
+    return {'Accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': f"token {token}"}
+
+
+def is_large_document(size):
+    """
+    Returns True if the document of "size" bytes is uploaded through the large document flow
+    """
+    return LARGE_DOCUMENTS['large_threshold'] is not None and size > LARGE_DOCUMENTS['large_threshold']
+
+
+def bulk_processing(size):
     """
-    xml_file arg: file name or path to xml file
-    Returns the string of xml file and string of xml file in base64 format
+    Returns bulk_processing field of the upload request of the document of "size" bytes
     """
-    with open(xml_file, 'r') as file:
-        xml_string = file.read()   # reads without " " or "\n"
-        xml_base64_string = base64.b64encode(xml_string.encode()).decode()
+    bulk = LARGE_DOCUMENTS['bulk_threshold'] is not None and size > LARGE_DOCUMENTS['bulk_threshold']
+    return 'true' if bulk else 'false'
 
-    return xml_string, xml_base64_string  
+
+def upload_timeout(size):
+    """
+    Returns the time limit (seconds) of sending "size" bytes and receiving the response
+    """
+    return UPLOAD_TIMEOUT + size / LARGE_DOCUMENTS['min_speed']
 
 
-def document_upload_request(session, xml_base64_string, signed_xml_base64, token):
+def document_upload_body(xml_file, signed_xml_base64, request_id, digest=None):
+    """
+    Returns json body of documents/send request, which reads and encodes the xml file into base64 while it is sent
+    (memory of an upload doesn't depend on the size of the document)
+    "digest" - sha256 of the signed file, the upload is broken off if the file has changed since the signing
+    """
+    return DocumentBody(xml_file, signed_xml_base64, request_id, digest,
+                        bulk_processing(document_size(xml_file)))
+
+
+def document_upload_request(session, xml_file, signed_xml_base64, token, request_id=None, digest=None):
     """
     Uploads the signed xml document into mdlp.crpt.ru database, using the session key(token) received from authorization request
+    "xml_file" - path to the signed xml file, it is streamed into the request body
+    "request_id" - the id of the previous attempt to upload the same document (random UUID if it is None)
+    Documents larger than LARGE_DOCUMENTS['large_threshold'] are uploaded with large_document_upload_request
     """
     # random UUID
-    request_id = str(uuid.uuid4())
+    request_id = request_id or str(uuid.uuid4())
+    if is_large_document(document_size(xml_file)):
+        return large_document_upload_request(session, xml_file, signed_xml_base64, token, request_id, digest)
 
     url = BASE_URL + 'documents/send' 
-    headers = {'Accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': f"token {token}"}
+    headers = document_upload_headers(token)
+    data = document_upload_body(xml_file, signed_xml_base64, request_id, digest)
+
+    session.rate_limiter.acquire('documents/send')
+    with get_collector().measure('upload', len(data)):
+        response = session.post(url, headers=headers, data=data, timeout=(10, upload_timeout(len(data))))
+    session.rate_limiter.update('documents/send', response)
+
+    return response
+
+
+def large_document_upload_request(session, xml_file, signed_xml_base64, token, request_id, digest=None):
+    """
+    Uploads the large signed xml document in three requests:
+    documents/send_large with the sha256 hash of the file and its signature gets the document id and the link,
+    the file is streamed to the link as it is on disk (PUT), documents/send_finished completes the upload
+    "digest" - sha256 of the signed file (computed if it is None)
+    Returns the response of documents/send_large (with document_id), raises HTTPError for failed requests
+    """
+    if digest is None:
+        with open_document(xml_file) as file:
+            digest = content_hash(file.read())
+    headers = document_upload_headers(token)
     data = {
-        "document": xml_base64_string,  # xml document as base64 format string
+        "document_hash": digest,
         "sign": signed_xml_base64,   # signed document as base64 format string
-        "request_id": request_id,   
-        "bulk_processing": "false"
+        "request_id": request_id,
+        "bulk_processing": bulk_processing(document_size(xml_file))
     }
+    body = FileBody(xml_file, digest)
+
+    with get_collector().measure('upload large', len(body)):
+        session.rate_limiter.acquire('documents/send_large')
+        response = session.post(BASE_URL + 'documents/send_large', headers=headers, data=json.dumps(data),
+                                timeout=(10, UPLOAD_TIMEOUT))
+        session.rate_limiter.update('documents/send_large', response)
+        response.raise_for_status()
+        document = response.json()
 
-    response = session.post(url, headers=headers, data=json.dumps(data), timeout=(10, 10))
+        # the file is sent to the storage of the link, without the session key
+        upload = session.put(document['link'], data=body, headers={'Content-Type': 'application/xml'},
+                             timeout=(10, upload_timeout(len(body))))
+        upload.raise_for_status()
+
+        session.rate_limiter.acquire('documents/send_finished')
+        finished = session.post(BASE_URL + 'documents/send_finished', headers=headers,
+                                data=json.dumps({"document_id": document['document_id']}),
+                                timeout=(10, UPLOAD_TIMEOUT))
+        session.rate_limiter.update('documents/send_finished', finished)
+        finished.raise_for_status()
 
     return response
 
 
-def main():
-    # create session
-    s = create_session()
+def document_status_request(session, document_id, token):
+    """
+    Requests the metadata of the uploaded document, using the session key(token)
+    Gets response like:
+    {
+        "document_id": "60b5a3f1-c8ab-4d2c-a1b4-2fd0a5ee5a8d",
+        "doc_status": "PROCESSED_DOCUMENT",
+        ...
+    }
+    """
+    url = BASE_URL + f'documents/{document_id}'
+    headers = {'Accept': 'application/json', 'Authorization': f"token {token}"}
+
+    session.rate_limiter.acquire('documents/status')
+    with get_collector().measure('status'):
+        response = session.get(url, headers=headers, timeout=(10, 10))
+    session.rate_limiter.update('documents/status', response)
+
+    return response
+
+
+def document_ticket_request(session, document_id, token):
+    """
+    Requests the link to the processing result (ticket) of the document
+    Gets response like:
+    {
+        "link": "https://..."
+    }
+    """
+    url = BASE_URL + f'documents/{document_id}/ticket'
+    headers = {'Accept': 'application/json', 'Authorization': f"token {token}"}
+
+    session.rate_limiter.acquire('documents/status')
+    response = session.get(url, headers=headers, timeout=(10, 10))
+    session.rate_limiter.update('documents/status', response)
+
+    return response
+
+
+def document_status(session, tokens, document_id):
+    """
+    Returns the processing status of the uploaded document (doc_status)
+    A rejected session key(token) is forgotten, so the next poll is made with a new one
+    """
+    token = tokens.get()
+    response = document_status_request(session, document_id, token)
+    if response.status_code == 401:
+        tokens.invalidate(token)
+    response.raise_for_status()
+
+    return response.json()['doc_status']
+
+
+def document_errors(session, tokens, document_id):
+    """
+    Downloads the ticket of the rejected document
+    Returns its errors as "code: description" strings joined with "; "
+    """
+    response = document_ticket_request(session, document_id, tokens.get())
+    response.raise_for_status()
+    ticket = session.get(response.json()['link'], timeout=(10, 10))
+    ticket.raise_for_status()
+
+    errors = []
+    for element in ElementTree.fromstring(ticket.content).iter('errors'):
+        errors.append(f"{element.findtext('error_code', '')}: {element.findtext('error_desc', '')}")
+
+    return '; '.join(errors)
 
-    # get response of authentication request
-    try:
-        auth_response = authentication_request(s)
-        auth_response.raise_for_status()
-    except requests.exceptions.HTTPError as errh: 
-        print("HTTP Error") 
-        print(errh.args[0]) 
-        sys.exit()
-    except requests.exceptions.ReadTimeout as errrt: 
-        print("Time out") 
-        print(errrt.args[0])
-        sys.exit()
-    except requests.exceptions.ConnectionError as conerr: 
-        print("Connection error") 
-        print(conerr.args[0])
-        sys.exit()
-    except requests.exceptions.RequestException as errex: 
-        print("Exception request") 
-        print(errex.args[0])
-        sys.exit()
-        
-    # requiered time intervals between requests 
-    time.sleep(0.5)
 
+def authorize(session, cert):
+    """
+    Authentication request + signing of the received code + authorization request
+    Returns the authorization response like:
+    {
+        "token": "cb33fd3a-1104-48de-88b2-1a64434f1eb5",
+        "life_time": 30
+    }
+    """
+    # get response of authentication request
+    auth_response = authentication_request(session)
+    auth_response.raise_for_status()
     # extracting code from the response
     code = auth_response.json()["code"]
 
-    # loading the private certificate file from CryptoPro certmgr
-    cert = load_certificate()
-    
     # sign the code for futher authorization request
     # it is already in base64
     code_signature = sign_the_code_or_xml_document(cert, code)
 
     # authorization request
+    authoriz_response = authorization_request(session, code, code_signature)
+    authoriz_response.raise_for_status()
+
+    return authoriz_response.json()
+
+
+def create_token_manager(session, cert):
+    """
+    Returns the manager of the session key(token), which renews it in the background before it expires
+    and shares it with other loaders through TOKEN_CACHE file
+    """
+    account = session.account
+    # every account has its own cache file
+    cache_path = TOKEN_CACHE
+    if account.name:
+        root, extension = os.path.splitext(TOKEN_CACHE)
+        cache_path = f"{root}_{account.name}{extension}"
+
+    return TokenManager(lambda: authorize(session, cert), cache_path, account.user_id)
+
+
+def upload_documents(session, cert, tokens, paths, on_verified=None):
+    """
+    Reads, signs and uploads xml files (paths) through the staged pipeline
+    (or with the asyncio engine if ASYNC_UPLOADS), so the signing of the next file overlaps the uploading of the previous one
+    Files already uploaded with the same content (according to the journal) are skipped,
+    with COORDINATION only the files claimed by this loader are uploaded
+    Files failed with transient errors are retried according to RETRY, only the last attempt is yielded
+    Yields the job (dict with "filename", "path", "response", "skipped" and "error" keys) of every file when it is done
+    on_verified(job, error) - called when the signature of the file, verified in the background (VERIFY_MODE 'async'),
+    has been checked ("error" - None if it is valid); such jobs have "verifying" True (set before they are yielded)
+    """
+    journal = get_journal()
+    validator = get_validator()
+    claims = get_claims()
+    collector = get_collector()
+    collector.start()
+
+    def validate(job):
+        # malformed documents fail here, before they are signed and sent
+        with collector.measure('validate'):
+            job['action_id'] = validator.check(job['path'])
+
+    # large files are hashed with the algorithm of the certificate
+    algorithm = hash_algorithm(cert) if HASH_SIGNING_THRESHOLD is not None else None
+
+    def read(job):
+        job['hash'], job['document'] = xml_file_convertation(job['path'], algorithm)
+        if journal.status(job['key'], job['hash']) == UPLOADED:
+            job['skipped'] = True
+
+    signing_pool = get_signing_pool(session.account.thumbprint)
+    cache = get_signature_cache()
+    thumbprint = cert.Thumbprint if cache else None
+
+    def accepted(job, options, signature):
+        if cache:
+            cache.put(job['hash'], thumbprint, options, ''.join(signature.splitlines()))
+        if job.get('verifying'):
+            on_verified(job, None)
+
+    def rejected(job, error):
+        if job.get('verifying'):
+            on_verified(job, error)
+
+    def sign(job):
+        # gets signature of xml document in base64 (the same base64 string is signed and sent)
+        # or of its hash for large files
+        # the base64 string isn't kept after the signing, the file is encoded again while it is sent
+        document = job.pop('document')
+        options = signing_options(document)
+        # the signature of the same document made earlier with the same certificate
+        if cache:
+            job['signed_xml'] = cache.get(job['hash'], thumbprint, options)
+            if job['signed_xml']:
+                return
+        # the signature is cached when it has been verified (in the background with VERIFY_MODE 'async'),
+        # so an invalid one isn't reused
+        job['verifying'] = on_verified is not None and VERIFY_MODE == 'async'
+        on_valid = functools.partial(accepted, job, options)
+        on_invalid = functools.partial(rejected, job)
+        try:
+            if signing_pool:
+                job['signed_xml'] = signing_pool.submit(document, job['filename'], on_valid, on_invalid).result()
+            else:
+                job['signed_xml'] = sign_the_document(cert, document, job['filename'], on_valid, on_invalid)
+        except Exception:
+            # not signed, nothing to verify
+            job['verifying'] = False
+            raise
+
+    def upload(job):
+        # the same request_id as in the previous attempts of the file
+        request_id = journal.begin(job['key'], job['hash'], session.account.name)
+        # the token is kept to be renewed if it is rejected
+        job['token'] = tokens.get()
+        response = document_upload_request(session, job['path'], job.pop('signed_xml'),
+                                           job['token'], request_id, job['hash'])
+        response.raise_for_status()
+        job['response'] = response
+
+    def prepare(job):
+        # checking, reading, signing and the request for the asyncio engine
+        if validator:
+            validate(job)
+        read(job)
+        if job.get('skipped'):
+            return None
+        sign(job)
+        request_id = journal.begin(job['key'], job['hash'], session.account.name)
+        if is_large_document(document_size(job['path'])):
+            # large documents are uploaded here, in the thread, with their own time limits
+            job['token'] = tokens.get()
+            return large_document_upload_request(session, job['path'], job.pop('signed_xml'),
+                                                 job['token'], request_id, job['hash'])
+        data = document_upload_body(job['path'], job.pop('signed_xml'), request_id, job['hash'])
+        session.rate_limiter.acquire('documents/send')
+        job['token'] = tokens.get()
+        job['upload_started'] = time.perf_counter()
+        job['upload_size'] = len(data)
+        return BASE_URL + 'documents/send', document_upload_headers(job['token']), data, upload_timeout(len(data))
+
+    def finish(job, response):
+        collector.observe('upload', time.perf_counter() - job['upload_started'], job['upload_size'])
+        session.rate_limiter.update('documents/send', response)
+        response.raise_for_status()
+
+    signer_workers = max(PIPELINE['signer']['workers'], SIGNING_PROCESSES)
+    # failed files come back into the jobs after a delay
+    scheduler = RetryScheduler(RETRY['max_attempts'], RETRY['base_delay'], RETRY['max_delay'])
+    if claims:
+        # the files no other loader has taken
+        paths = claims.claimed(paths)
+    jobs = scheduler.jobs({'filename': document_name(path), 'path': path, 'key': os.path.abspath(path)}
+                          for path in paths)
+
+    if ASYNC_UPLOADS:
+        ssl_context = create_ssl_context() if BASE_URL.startswith('https') else None
+        # one more thread takes the next paths
+        uploader = AsyncUploader(BASE_URL, ssl_context, ASYNC_UPLOADS, UPLOAD_TIMEOUT, signer_workers + 1)
+        results = uploader.run(jobs, prepare, finish)
+    else:
+        stages = [
+            Stage('reader', read, **PIPELINE['reader']),
+            Stage('signer', sign, signer_workers, PIPELINE['signer']['queue_size']),
+            Stage('uploader', upload, **PIPELINE['uploader']),
+        ]
+        if validator:
+            validator_workers = max(PIPELINE['validator']['workers'], VALIDATION['processes'])
+            stages.insert(0, Stage('validator', validate, validator_workers, PIPELINE['validator']['queue_size']))
+        results = run_pipeline(jobs, stages)
+
+    try:
+        for job in results:
+            # the rejected token is renewed before the job is handed back for the retry,
+            # so the retry doesn't take the same token
+            if job['error'] is not None and classify_error(job['error']) == AUTH:
+                tokens.invalidate(job.get('token'))
+            final = scheduler.done(job)
+            if not final:
+                collector.count('retried')
+                continue
+            # a member which couldn't be read from its broken archive has no content: it is journaled as empty
+            if 'hash' not in job and getattr(job['path'], 'error', None) is not None:
+                job['hash'] = content_hash(b'')
+            # saves the result into the journal
+            if 'hash' in job and not job.get('skipped'):
+                if job['error'] is None:
+                    journal.uploaded(job['key'], job['hash'], document_id(job['response']))
+                else:
+                    journal.failed(job['key'], job['hash'], error_description(job['error'])[1],
+                                   session.account.name)
+            if claims:
+                claims.finish(job['path'], job['error'] is None)
+            if job.get('skipped'):
+                outcome = 'skipped'
+            else:
+                outcome = 'loaded' if job['error'] is None else 'failed'
+            collector.count(outcome)
+            collector.log('document', file=job.get('key'), account=session.account.name, status=outcome,
+                          attempts=job.get('attempt'), stage=job.get('stage'),
+                          error=error_description(job['error'])[1] if job['error'] else None,
+                          document_id=document_id(job['response']) if job.get('response') is not None else None)
+            yield job
+    finally:
+        scheduler.close()
+    journal.flush()
+    if any(scheduler.stats.values()):
+        print(scheduler.summary())
+
+
+def finish_run(sessions):
+    """
+    Waits for the signatures verified in the background, prints the counters of the run
+    (verification, TLS connections of every session, signature cache, stage timings, claims)
+    and the settings which aren't the defaults; closes the journal, the signature cache, the metrics and the claims,
+    stops the signing and validating processes
+    """
+    global _validator
+    if SETTINGS.sources:
+        print(SETTINGS.summary())
+    get_verifier().wait()
+    print(get_verifier().summary())
+    for s in sessions:
+        summary = s.get_adapter(URL).tls_stats.summary()
+        print(f"{s.account.name}: {summary}" if s.account.name else summary)
+    if get_signature_cache():
+        print(get_signature_cache().summary())
+        get_signature_cache().close()
+    collector = get_collector()
+    if collector.enabled:
+        print(collector.summary())
+        collector.close()
+    if get_claims():
+        # files claimed but not finished are left to the other loaders
+        print(get_claims().summary())
+        get_claims().close()
+    with _resources_lock:
+        for pool in _signing_pools.values():
+            pool.shutdown()
+        _signing_pools.clear()
+        if _validator is not None:
+            _validator.shutdown()
+            _validator = None
+    get_journal().close()
+
+
+def get_accounts():
+    """
+    Returns the accounts of ACCOUNTS_PATH file, or the default account if there is no such file
+    """
+    SETTINGS.load()
+    if os.path.exists(ACCOUNTS_PATH):
+        return read_accounts(ACCOUNTS_PATH)
+    return [get_default_account()]
+
+
+def connect_account(account):
+    """
+    Creates the session of the account, loads its certificate and creates its token manager
+    (the token is received at the first get())
+    """
+    # the default account (of info.csv) shares the rate limiter of the module; it isn't made here to be compared,
+    # with accounts.csv there may be no info.csv
+    account.session = create_session(None if account is _default_account else account)
+    # loading the private certificate file from CryptoPro certmgr
+    account.cert = load_certificate(account.thumbprint)
+    account.tokens = create_token_manager(account.session, account.cert)
+
+
+def upload_files(accounts, paths, on_verified=None):
+    """
+    Uploads the files with the only account, or routes them to the accounts (by directory or sender)
+    and uploads for all of them at once
+    Yields the jobs like upload_documents (on_verified is passed to it)
+    """
+    if len(accounts) == 1:
+        account = accounts[0]
+        return upload_documents(account.session, account.cert, account.tokens, paths, on_verified)
+
+    return upload_for_accounts(accounts, paths,
+                               lambda account, paths: upload_documents(account.session, account.cert,
+                                                                       account.tokens, paths, on_verified))
+
+
+def document_id(response):
+    """
+    Returns the id of the document from documents/send response (None if there is no one)
+    """
     try:
-        authoriz_response = authorization_request(s, code, code_signature)
-        authoriz_response.raise_for_status()
+        return response.json().get('document_id')
+    except ValueError:
+        return None
+
+
+def scan_xml_files(directory):
+    """
+    Yields paths of xml files of the directory according to SCAN settings
+    and the xml members (ArchiveMember) of its archives (ARCHIVE_PATTERNS)
+    """
+    for path in scan_directory(directory, SCAN['include'] + ARCHIVE_PATTERNS, SCAN['exclude'], SCAN['recursive'],
+                               SCAN['order']):
+        if any(fnmatch(os.path.basename(path), pattern) for pattern in ARCHIVE_PATTERNS):
+            yield from read_archive(path, SCAN['include'])
+        else:
+            yield path
+
+
+def count_xml_files(directory):
+    """
+    Returns the number of xml files of the directory according to SCAN settings, with the xml members of its archives,
+    None if there is a compressed tar archive (its members are known only when it is read, see count_members)
+    """
+    if not ARCHIVE_PATTERNS:
+        return count_files(directory, SCAN['include'], SCAN['exclude'], SCAN['recursive'])
+    count = 0
+    for path in scan_directory(directory, SCAN['include'] + ARCHIVE_PATTERNS, SCAN['exclude'], SCAN['recursive']):
+        if any(fnmatch(os.path.basename(path), pattern) for pattern in ARCHIVE_PATTERNS):
+            members = count_members(path, SCAN['include'])
+            if members is None:
+                return None
+            count += members
+        else:
+            count += 1
+    return count
+
+
+def error_description(error):
+    """
+    Returns the title and the message of the error raised while loading a file
+    """
+    if isinstance(error, requests.exceptions.HTTPError):
+        title = "HTTP Error"
+    elif isinstance(error, requests.exceptions.ReadTimeout):
+        title = "Time out"
+    elif isinstance(error, requests.exceptions.ConnectionError):
+        title = "Connection error"
+    elif isinstance(error, requests.exceptions.RequestException):
+        title = "Exception request"
+    else:
+        title = type(error).__name__
+    message = error.args[0] if error.args else str(error)
+
+    return title, message
+
+
+def main(argv=None):
+    # settings of info/config.json, the environment and the command line
+    configure(argv, "Signs and uploads the xml files of PATH_TO_DIRECTORY_WITH_XML")
+    # accounts of info.csv or ACCOUNTS_PATH file,
+    # every one with its session, private certificate (from CryptoPro certmgr) and token manager
+    accounts = get_accounts()
+    for account in accounts:
+        connect_account(account)
+
+    # session keys(tokens) from the cache or from authentication and authorization requests
+    try:
+        for account in accounts:
+            account.tokens.get()
     except requests.exceptions.HTTPError as errh: 
         print("HTTP Error") 
         print(errh.args[0]) 
@@ -246,10 +1226,6 @@ def main():
         print(errex.args[0])
         sys.exit()
 
-    time.sleep(0.5)
-    
-    # getting session key(token)
-    token = authoriz_response.json()["token"]
     # create the csv file for following errors 
     with open('info/unloaded.csv', 'w', newline='') as csvfile:
                         fieldnames = ['filename', 'error']
@@ -257,48 +1233,29 @@ def main():
 
                         writer.writeheader()
 
-    number_of_xmls = len(os.listdir(PATH_TO_DIRECTORY_WITH_XML))
+    number_of_xmls = count_xml_files(PATH_TO_DIRECTORY_WITH_XML)
     number_of_loaded_xmls = 0
-    # iterate over all files in the directory with xml files
-    for filename in os.listdir(PATH_TO_DIRECTORY_WITH_XML):
-        path_to_xml_file = os.path.join(PATH_TO_DIRECTORY_WITH_XML, filename)
-        # checks if not a directory and the extension
-        if os.path.isfile(path_to_xml_file) and os.path.splitext(filename)[1] == ".xml":
-            error = None
-            # creating xml document string
-            xml_string, xml_base64_string = xml_file_convertation(path_to_xml_file)  # xml_path
-            
-            # gets signature of xml document in base64
-            signed_xml = sign_the_code_or_xml_document(cert, xml_string)
-
-            # sends signed xml document
-            try:
-                upload_response = document_upload_request(s, xml_base64_string, signed_xml, token)
-                upload_response.raise_for_status()
-            except requests.exceptions.HTTPError as errh: 
-                print("HTTP Error") 
-                error = errh.args[0]
-            except requests.exceptions.ReadTimeout as errrt: 
-                print("Time out") 
-                error = errrt.args[0]
-            except requests.exceptions.ConnectionError as conerr: 
-                print("Connection error") 
-                error = conerr.args[0]
-            except requests.exceptions.RequestException as errex: 
-                print("Exception request") 
-                error = errex.args[0]
-            else:
-                 number_of_loaded_xmls += 1
-                 print(f"Loaded: {number_of_loaded_xmls} out of {number_of_xmls}")
-            # if the file haven't been loaded successfully  
-            if error:
-                with open('info/unloaded.csv', 'a', newline='') as csvfile:
-                        fieldnames = ['filename', 'error']
-                        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                        # write the name of the file and the error to csv file
-                        writer.writerow({'filename': filename, 'error': error})
+    # xml files of the directory, found while the previous ones are being uploaded
+    paths = scan_xml_files(PATH_TO_DIRECTORY_WITH_XML)
+    # read, sign and upload files (for all the accounts at once)
+    for job in upload_files(accounts, paths):
+        if job.get('skipped'):
+            number_of_loaded_xmls += 1
+            print(f"Already loaded: {job['filename']}")
+            continue
+        if job['error'] is None:
+            number_of_loaded_xmls += 1
+            # the total is unknown with compressed tar archives
+            print(f"Loaded: {number_of_loaded_xmls} out of {number_of_xmls}" if number_of_xmls is not None
+                  else f"Loaded: {number_of_loaded_xmls}")
+            continue
+        title, error = error_description(job['error'])
+        print(title)
+        # if the file haven't been loaded successfully
+        report_error(job['filename'], error)
 
-            time.sleep(0.5)
+    # signatures which are verified in the background and the counters of the run
+    finish_run([account.session for account in accounts])
 
 
 
@@ -1,15 +1,11 @@
 import csv
-import requests
-import sys
-import time
-import os
-from load_xml import (create_session, 
-                      authentication_request, 
-                      authorization_request, 
-                      sign_the_code_or_xml_document, 
-                      load_certificate, xml_file_convertation, 
-                      document_upload_request)
-from load_unloaded import copy_csv
+import queue
+import threading
+from load_xml import (configure, get_accounts, connect_account, upload_files,
+                      error_description, report_error, get_verifier, finish_run,
+                      scan_xml_files, count_xml_files)
+from load_unloaded import unfinished_files
+from archives import read_documents
 import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog
@@ -17,124 +13,207 @@ from tkinter.scrolledtext import ScrolledText
 from tkinter import messagebox
 
 
+FRAME_RATE = 10  # redraws of the window per second while the files are being uploaded
 
-def receive_token():
+# Everything slow (authentication, signing, requests) runs in the background worker thread,
+# which sends messages to the window through this queue; the window reads them FRAME_RATE times per second
+events = queue.Queue()
+resumed = threading.Event()  # cleared while uploading is paused
+resumed.set()
+cancelled = threading.Event()  # set when uploading is cancelled
+worker = None  # the thread uploading the files
+accounts = []  # accounts with their sessions, certificates and token managers (connected when the window is up)
+number_of_xmls = 0  # files of the current uploading
+closing = False  # the window is closed as soon as the worker finishes
+# the window (root) and its widgets are created by main()
+
+
+def connect_accounts():
     """
-    Returns session, certificate, token
+    Runs in the background: connects the accounts (certificates, sessions) and receives the session keys(tokens)
+    from the cache or from authentication and authorization requests
     """
-    # create session
-    s = create_session()
-
-    # get response of authentication request
-    try:
-        auth_response = authentication_request(s)
-        auth_response.raise_for_status()
-    except requests.exceptions.HTTPError as errh:  
-        # Display an error message
-        messagebox.showerror("Error", f"{errh.args[0]}")
-        sys.exit()
-    except requests.exceptions.ReadTimeout as errrt: 
-        messagebox.showerror("Error", f"{errrt.args[0]}")
-        sys.exit()
-    except requests.exceptions.ConnectionError as conerr: 
-        messagebox.showerror("Error", f"{conerr.args[0]}")
-        sys.exit()
-    except requests.exceptions.RequestException as errex: 
-        messagebox.showerror("Error", f"{errex.args[0]}")
-        sys.exit()
-        
-    # requiered time intervals between requests 
-    time.sleep(0.5)
-
-    # extracting code from the response
-    code = auth_response.json()["code"]
-
-    # loading the private certificate file from CryptoPro certmgr
-    cert = load_certificate()
-    
-    # sign the code for futher authorization request
-    # it is already in base64
-    code_signature = sign_the_code_or_xml_document(cert, code)
-
-    # authorization request
     try:
-        authoriz_response = authorization_request(s, code, code_signature)
-        authoriz_response.raise_for_status()
-    except requests.exceptions.HTTPError as errh: 
-        messagebox.showerror("Error", f"{errh.args[0]}") 
-        sys.exit()
-    except requests.exceptions.ReadTimeout as errrt: 
-        messagebox.showerror("Error", f"{errrt.args[0]}")
-        sys.exit()
-    except requests.exceptions.ConnectionError as conerr: 
-        messagebox.showerror("Error", f"{conerr.args[0]}")
-        sys.exit()
-    except requests.exceptions.RequestException as errex: 
-        messagebox.showerror("Error", f"{errex.args[0]}")
-        sys.exit()
-
-    time.sleep(0.5)
-    
-    # getting session key(token)
-    token = authoriz_response.json()["token"]
-
-    return s, cert, token
-
-
-def load(list_of_filenames, number_of_xmls, number_of_loaded_xmls=0):
-    """
-    Args: list with filenames, number of xmls
-    Returns the number of loaded xmls
+        for account in get_accounts():
+            connect_account(account)
+            account.tokens.get()
+            accounts.append(account)
+    except Exception as err:
+        events.put(('fatal', error_description(err)[1]))
+        return
+    events.put(('connected',))
+
+
+def controlled(paths):
     """
-    global PATH_TO_DIRECTORY_WITH_XML
-    # iterate over files in the directory with xml files
-    for filename in list_of_filenames:
-        path_to_xml_file = os.path.join(PATH_TO_DIRECTORY_WITH_XML, filename)
-        # checks if not a directory and the extension
-        if os.path.isfile(path_to_xml_file) and os.path.splitext(filename)[1] == ".xml":
-            error = None
-            # creating xml document string
-            xml_string, xml_base64_string = xml_file_convertation(path_to_xml_file)  # xml_path
-            
-            # gets signature of xml document in base64
-            signed_xml = sign_the_code_or_xml_document(cert, xml_string)
-
-            # sends signed xml document
-            try:
-                upload_response = document_upload_request(s, xml_base64_string, signed_xml, token)
-                upload_response.raise_for_status()
-            except requests.exceptions.HTTPError as errh:  
-                error = errh.args[0]
-            except requests.exceptions.ReadTimeout as errrt: 
-                error = errrt.args[0]
-            except requests.exceptions.ConnectionError as conerr: 
-                error = conerr.args[0]
-            except requests.exceptions.RequestException as errex:  
-                error = errex.args[0]
-            else:
-                    number_of_loaded_xmls += 1
-                    progress['value'] = number_of_loaded_xmls
-                    progress.update()
-                    progress_label['text'] = f"Loaded: {number_of_loaded_xmls} out of {number_of_xmls}"
-        
-            # if the file haven't been loaded successfully  
-            if error:
-                with open('info/unloaded.csv', 'a', newline='') as csvfile:
-                        fieldnames = ['filename', 'error']
-                        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                        # write the name of the file and the error to csv file
-                        writer.writerow({'filename': filename, 'error': error})
+    Yields the paths while uploading isn't cancelled and waits while it is paused
+    (the files already being read, signed or uploaded are finished)
+    """
+    for path in paths:
+        resumed.wait()
+        if cancelled.is_set():
+            return
+        yield path
+
+
+def load(paths):
+    """
+    Runs in the background: reads, signs and uploads the files, reports every result to the window
+    Args: paths of xml files (list or iterator)
+    Returns the numbers of loaded and failed xmls
+    """
+    number_of_loaded_xmls = 0
+    number_of_failed_xmls = 0
+    for job in upload_files(accounts, controlled(paths)):
+        if job['error'] is None:
+            number_of_loaded_xmls += 1
+            events.put(('loaded', number_of_loaded_xmls))
+            continue
+        # if the file haven't been loaded successfully
+        number_of_failed_xmls += 1
+        _, error = error_description(job['error'])
+        report_error(job['filename'], error)
+        events.put(('failed', job['filename'], error))
+    # signatures which are verified in the background
+    get_verifier().wait()
+
+    return number_of_loaded_xmls, number_of_failed_xmls
+
+
+def start_loading(find_files, on_finish):
+    """
+    Starts uploading in the worker thread
+    find_files() - returns the paths of the files to load and their number (None if it isn't known beforehand),
+                   called in the worker
+    on_finish(loaded, failed, total) - called in the window when all of them are processed
+    """
+    global worker
+
+    def work():
+        try:
+            paths, total = find_files()
+            events.put(('total', total))
+            loaded, failed = load(paths)
+        except Exception as err:
+            events.put(('error', error_description(err)[1]))
+            return
+        if total is None:
+            # compressed tar archives aren't counted beforehand: the total is what has been found
+            total = loaded + failed
+        events.put(('done', on_finish, loaded, failed, total))
+
+    cancelled.clear()
+    resumed.set()
+    set_running(True)
+    worker = threading.Thread(target=work, name='uploader', daemon=True)
+    worker.start()
+
+
+def poll():
+    """
+    Shows the messages of the worker, FRAME_RATE times per second
+    (progress is redrawn once per frame, however many files have been loaded meanwhile)
+    """
+    global number_of_xmls
+
+    loaded = None
+    lines = []
+    while True:
+        try:
+            event, *args = events.get_nowait()
+        except queue.Empty:
+            break
+        if event == 'loaded':
+            loaded = args[0]
+        elif event == 'failed':
+            lines.append(f"Failed: {args[0]}: {args[1]}")
+        elif event == 'total':
+            number_of_xmls = args[0]
+            # sets maximum for progressbar (without it, if the total is unknown, the bar only moves)
+            progress['mode'] = 'determinate' if number_of_xmls is not None else 'indeterminate'
+            progress['maximum'] = number_of_xmls or 100
+            progress['value'] = 0
+            show_progress(0)
+        elif event == 'connected':
+            progress_label['text'] = "Ready"
+            load_files_btn.config(state=tk.NORMAL)
+        elif event == 'fatal':
+            messagebox.showerror("Error", args[0])
+            root.destroy()
+            return
+        elif event == 'error':
+            set_running(False)
+            messagebox.showerror("Error", args[0])
+        elif event == 'done':
+            on_finish, *counts = args
+            if loaded is not None:
+                show_progress(loaded)
+                loaded = None
+            if lines:
+                text.insert(tk.END, '\n'.join(lines) + '\n')
+                lines = []
+            set_running(False)
+            on_finish(*counts)
+
+    if loaded is not None:
+        show_progress(loaded)
+    if lines:
+        text.insert(tk.END, '\n'.join(lines) + '\n')
+        text.see(tk.END)
+
+    if closing and (worker is None or not worker.is_alive()):
+        close()
+        return
+    root.after(1000 // FRAME_RATE, poll)
+
+
+def show_progress(number_of_loaded_xmls):
+    progress['value'] = number_of_loaded_xmls
+    progress_label['text'] = (f"Loaded: {number_of_loaded_xmls} out of {number_of_xmls}" if number_of_xmls is not None
+                              else f"Loaded: {number_of_loaded_xmls}")
+
+
+def set_running(running):
+    """
+    Enables the buttons of uploading or the Pause/Cancel buttons
+    """
+    state, control_state = (tk.DISABLED, tk.NORMAL) if running else (tk.NORMAL, tk.DISABLED)
+    load_files_btn.config(state=state)
+    load_failed_files_btn.config(state=state)
+    pause_btn.config(state=control_state, text="Pause")
+    cancel_btn.config(state=control_state)
+
+
+def pause():
+    """
+    Pauses uploading (no new files are taken) or resumes it
+    """
+    if resumed.is_set():
+        resumed.clear()
+        pause_btn.config(text="Resume")
+        text.insert(tk.END, "Paused\n")
+    else:
+        resumed.set()
+        pause_btn.config(text="Pause")
+        text.insert(tk.END, "Resumed\n")
+
+
+def cancel():
+    """
+    Cancels uploading: no new files are taken, the ones in progress are finished
+    """
+    cancelled.set()
+    resumed.set()
+    pause_btn.config(state=tk.DISABLED)
+    cancel_btn.config(state=tk.DISABLED)
+    text.insert(tk.END, "Cancelling...\n")
 
-            time.sleep(0.5)
-        
-    return number_of_loaded_xmls
 
-        
 def create_csv_for_errors():
     """
-    Creats or clears unloaded.csv file for writing in errors 
+    Creats or clears unloaded.csv file for writing in errors
     """
-    # create the csv file for following errors 
+    # create the csv file for following errors
     with open('info/unloaded.csv', 'w', newline='') as csvfile:
                         fieldnames = ['filename', 'error']
                         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
@@ -148,96 +227,128 @@ def first_loading():
     """
     global PATH_TO_DIRECTORY_WITH_XML
 
-    create_csv_for_errors()
-
     # Choosing of the directory with xmls
     PATH_TO_DIRECTORY_WITH_XML = filedialog.askdirectory(title="Select files to load")
     # if wasn't chosen
     if not PATH_TO_DIRECTORY_WITH_XML:
         return
-    
+
+    create_csv_for_errors()
     text.insert(tk.END, "Selected directory: " + PATH_TO_DIRECTORY_WITH_XML + "\n")
-    # number of xmls in the directory
-    number_of_xmls = len(os.listdir(PATH_TO_DIRECTORY_WITH_XML))
-    # sets maximum for progressbar
-    progress['maximum'] = number_of_xmls
+    directory = PATH_TO_DIRECTORY_WITH_XML
+
+    def find_files():
+        # xml files are found while the previous ones are being uploaded
+        return scan_xml_files(directory), count_xml_files(directory)
 
-    list_of_filenames = os.listdir(PATH_TO_DIRECTORY_WITH_XML)
+    start_loading(find_files, first_loading_finished)
 
-    number_of_loaded_xmls = load(list_of_filenames, number_of_xmls)
 
+def first_loading_finished(number_of_loaded_xmls, number_of_failed_xmls, number_of_xmls):
     if number_of_loaded_xmls == number_of_xmls:
-        text.insert(tk.END, "All files are loaded\n")  
+        text.insert(tk.END, "All files are loaded\n")
         # in the case of chosing another directory
         load_failed_files_btn.grid_forget()
-    else:
-        text.insert(tk.END, f"There are {number_of_xmls - number_of_loaded_xmls} failed loads\n")
+        return
+    if number_of_failed_xmls:
+        text.insert(tk.END, f"There are {number_of_failed_xmls} failed loads\n")
         # show the button for reloading
-        load_failed_files_btn.grid(row=3, column=1)  
+        load_failed_files_btn.grid(row=4, column=0, columnspan=2)
+    not_taken = number_of_xmls - number_of_loaded_xmls - number_of_failed_xmls
+    if cancelled.is_set() and not_taken:
+        text.insert(tk.END, f"Cancelled, {not_taken} files are left in the directory\n")
+    text.see(tk.END)
 
 
 def second_loading():
     """
-    Reloading unloaded files from "unloaded.csv"
+    Reloading unloaded files (according to the upload journal)
     """
-     # copy the unloaded filenames into 'unloaded_copy.csv' and return the the number of files
-    number_of_xmls = copy_csv()
     # clears the unloaded.csv file
     create_csv_for_errors()
 
-    # creates list of unloaded filenames
-    with open('unloaded_copy.csv', 'r') as unloaded_files:
-        failed_files = unloaded_files.read().splitlines()
+    def find_files():
+        # paths of the files whose last upload failed and their number
+        failed_files = unfinished_files()
+        return read_documents(failed_files), len(failed_files)
 
-    # sets maximum for progressbar
-    progress['maximum'] = number_of_xmls
+    start_loading(find_files, second_loading_finished)
 
-    number_of_loaded_xmls = load(failed_files, number_of_xmls)
-    
+
+def second_loading_finished(number_of_loaded_xmls, number_of_failed_xmls, number_of_xmls):
     if number_of_loaded_xmls == number_of_xmls:
         text.insert(tk.END, "All failed files are loaded\n")
-        load_failed_files_btn.grid_forget() 
+        load_failed_files_btn.grid_forget()
     else:
         text.insert(tk.END, f"{number_of_xmls - number_of_loaded_xmls} failed files need to be loaded again\n")
+    text.see(tk.END)
 
 
+def close():
+    """
+    Closes the window; uploading in progress is cancelled and finished first
+    """
+    global closing
+
+    if worker is not None and worker.is_alive():
+        if closing:
+            return
+        if not messagebox.askyesno("Exit", "Files are being uploaded. Cancel and exit?"):
+            return
+        # the window is closed by poll() when the worker finishes
+        closing = True
+        cancel()
+        return
+    if accounts:
+        # counters of the run, the journal and the caches are closed
+        finish_run([account.session for account in accounts])
+    root.destroy()
 
 
-# Global variables for other functions to use
-s, cert, token = receive_token()
-
-root = tk.Tk()
-
-progress = ttk.Progressbar(root, orient=tk.HORIZONTAL, length=420, mode='determinate')
-progress.grid(row=0, column=0, columnspan=2)
-
-progress_label = tk.Label(root, text="progress")
-progress_label.grid(row=1, column=0, columnspan=2)
-
-text = ScrolledText(root, height=5, width=50)
-text.grid(row=2, column=0, columnspan=2)
+def main(argv=None):
+    """
+    Creates the window and connects the accounts in the background (nothing happens when the module is imported)
+    """
+    global root, progress, progress_label, text, load_files_btn, pause_btn, cancel_btn, load_failed_files_btn
 
-# Button for first try loading
-load_files_btn = tk.Button(root, text="Load Files", command=first_loading)
-load_files_btn.grid(row=3, column=0)
+    # settings of info/config.json, the environment and the command line
+    configure(argv, "Window for uploading xml files")
 
-# Button fo reloading unloaded files
-load_failed_files_btn = tk.Button(root, text="Load Failed Files", command=second_loading)
+    root = tk.Tk()
 
-root.mainloop()
+    progress = ttk.Progressbar(root, orient=tk.HORIZONTAL, length=420, mode='determinate')
+    progress.grid(row=0, column=0, columnspan=2)
 
+    progress_label = tk.Label(root, text="Connecting...")
+    progress_label.grid(row=1, column=0, columnspan=2)
 
+    text = ScrolledText(root, height=5, width=50)
+    text.grid(row=2, column=0, columnspan=2)
 
+    # Button for first try loading (enabled when the accounts are connected)
+    load_files_btn = tk.Button(root, text="Load Files", command=first_loading, state=tk.DISABLED)
+    load_files_btn.grid(row=3, column=0)
 
+    # Buttons for pausing and cancelling uploading
+    pause_btn = tk.Button(root, text="Pause", command=pause, state=tk.DISABLED)
+    pause_btn.grid(row=3, column=1, sticky=tk.W)
+    cancel_btn = tk.Button(root, text="Cancel", command=cancel, state=tk.DISABLED)
+    cancel_btn.grid(row=3, column=1, sticky=tk.E)
 
+    # Button fo reloading unloaded files
+    load_failed_files_btn = tk.Button(root, text="Load Failed Files", command=second_loading)
 
+    root.protocol("WM_DELETE_WINDOW", close)
 
+    # authentication starts when the window is up
+    root.after(0, lambda: threading.Thread(target=connect_accounts, name='connect', daemon=True).start())
+    root.after(1000 // FRAME_RATE, poll)
 
+    root.mainloop()
 
-    
 
 
 
-    
+if __name__ == "__main__":
 
-    
\ No newline at end of file
+    main()
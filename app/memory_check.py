@@ -0,0 +1,52 @@
+import os
+import tracemalloc
+import uuid
+from load_xml import (configure,
+                      load_certificate,
+                      hash_algorithm,
+                      xml_file_convertation,
+                      sign_the_document,
+                      document_upload_body)
+
+
+def document_peak_memory(cert, path):
+    """
+    Reads, signs and prepares the request body of the xml file the same way the loaders do
+    Returns the size of the file and the peak of memory allocated by Python meanwhile (bytes)
+    (memory of the CryptoPro library itself isn't traced)
+    """
+    tracemalloc.start()
+    try:
+        digest, document = xml_file_convertation(path, hash_algorithm(cert))
+        signed_xml = sign_the_document(cert, document, os.path.basename(path))
+        del document
+        # the body is streamed chunk by chunk, as it is sent
+        # (with a new request_id, as the first attempt of the file)
+        for chunk in document_upload_body(path, signed_xml, str(uuid.uuid4()), digest):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return os.path.getsize(path), peak
+
+
+def main(argv=None):
+    """
+    python memory_check.py <xml file> [<xml file> ...]
+    Prints the peak memory per document in bytes and in sizes of the file
+    """
+    paths = configure(argv, "Peak memory of reading, signing and sending xml files", extra_args=True)
+    # loading the private certificate file from CryptoPro certmgr
+    cert = load_certificate()
+
+    for path in paths:
+        size, peak = document_peak_memory(cert, path)
+        print(f"{path}: {size} bytes, peak memory {peak} bytes ({peak / max(size, 1):.1f} x file size)")
+
+
+
+
+if __name__ == "__main__":
+  
+    main()
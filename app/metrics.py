@@ -0,0 +1,239 @@
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+QUANTILES = (0.5, 0.95, 0.99)
+SAMPLES = 10000   # latencies kept for every stage (a uniform sample of them after that)
+
+
+class _NoTimer:
+    """
+    What measure() returns when the metrics are off
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+class _Timer:
+    def __init__(self, collector, name, size):
+        self.collector = collector
+        self.name = name
+        self.size = size
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.collector.observe(self.name, time.perf_counter() - self.start, self.size, failed=exc_type is not None)
+        return False
+
+
+class _Stage:
+    """
+    Latencies, counts and bytes of one stage
+    """
+    def __init__(self):
+        self.count = 0
+        self.failed = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.samples = []
+
+    def add(self, seconds, size, failed):
+        self.count += 1
+        self.seconds += seconds
+        self.bytes += size
+        if failed:
+            self.failed += 1
+        if len(self.samples) < SAMPLES:
+            self.samples.append(seconds)
+        else:
+            # reservoir sampling: every latency has the same chance to be kept
+            i = random.randrange(self.count)
+            if i < SAMPLES:
+                self.samples[i] = seconds
+
+    def quantiles(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in QUANTILES}
+
+
+class MetricsCollector:
+    """
+    Timings of the stages of uploading (latency quantiles, counts, bytes), counters of events,
+    json log of documents ("log" file, one json object per line)
+    and Prometheus text metrics ("prometheus" file, rewritten every "interval" seconds,
+    and http://"host":"port"/metrics if "port" isn't 0; localhost only by default, "host" '' - all interfaces)
+    When it is not "enabled", measure() and the other methods do nothing
+    """
+    def __init__(self, enabled=False, log='', prometheus='', port=0, interval=10, namespace='mdlp_upload',
+                 host='127.0.0.1'):
+        self.enabled = enabled
+        self.log_path = log
+        self.prometheus_path = prometheus
+        self.port = port
+        self.host = host
+        self.interval = interval
+        self.namespace = namespace
+        self.stages = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.started = None
+        self.log_file = None
+
+    def start(self):
+        """
+        Opens the log, starts the periodic writing of the metrics file and the http endpoint
+        """
+        if not self.enabled or self.started is not None:
+            return
+        self.started = time.time()
+        if self.log_path:
+            self.log_file = open(self.log_path, 'a', buffering=1)
+        if self.prometheus_path:
+            threading.Thread(target=self._write_periodically, name='metrics', daemon=True).start()
+        if self.port:
+            collector = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = collector.prometheus().encode('utf-8')
+                    self.send_response(200 if self.path == '/metrics' else 404)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            server = ThreadingHTTPServer((self.host, self.port), Handler)
+            threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+
+    def measure(self, name, size=0):
+        """
+        Context manager which adds the time of its block to the "name" stage ("size" - bytes processed)
+        """
+        if not self.enabled:
+            return _NO_TIMER
+        return _Timer(self, name, size)
+
+    def observe(self, name, seconds, size=0, failed=False):
+        """
+        Adds the time of one run of the "name" stage
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = _Stage()
+            stage.add(seconds, size, failed)
+
+    def count(self, name, value=1):
+        """
+        Adds "value" to the "name" counter
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def log(self, event, **fields):
+        """
+        Writes the event with its fields as a json line into the log
+        """
+        if not self.enabled or self.log_file is None:
+            return
+        line = json.dumps({'time': round(time.time(), 3), 'event': event, **fields}, ensure_ascii=False, default=str)
+        with self.lock:
+            self.log_file.write(line + '\n')
+
+    def prometheus(self):
+        """
+        Returns the metrics in Prometheus text format
+        """
+        n = self.namespace
+        with self.lock:
+            stages = sorted((name, stage.quantiles(), stage.seconds, stage.count, stage.bytes, stage.failed)
+                            for name, stage in self.stages.items())
+            counters = sorted(self.counters.items())
+        # every metric family is one group of lines
+        lines = [f"# TYPE {n}_stage_seconds summary"]
+        for name, quantiles, seconds, count, _, _ in stages:
+            for q, value in quantiles.items():
+                lines.append(f'{n}_stage_seconds{{stage="{name}",quantile="{q}"}} {value:.6f}')
+            lines.append(f'{n}_stage_seconds_sum{{stage="{name}"}} {seconds:.6f}')
+            lines.append(f'{n}_stage_seconds_count{{stage="{name}"}} {count}')
+        lines.append(f"# TYPE {n}_stage_bytes_total counter")
+        lines += [f'{n}_stage_bytes_total{{stage="{name}"}} {size}' for name, _, _, _, size, _ in stages]
+        lines.append(f"# TYPE {n}_stage_failures_total counter")
+        lines += [f'{n}_stage_failures_total{{stage="{name}"}} {failed}' for name, _, _, _, _, failed in stages]
+        lines.append(f"# TYPE {n}_events_total counter")
+        lines += [f'{n}_events_total{{event="{name}"}} {value}' for name, value in counters]
+        if self.started is not None:
+            lines.append(f"# TYPE {n}_run_seconds gauge")
+            lines.append(f"{n}_run_seconds {time.time() - self.started:.3f}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self):
+        """
+        Rewrites the metrics file at once (the whole file is replaced, readers never see a half of it)
+        """
+        if not self.enabled or not self.prometheus_path:
+            return
+        tmp_path = self.prometheus_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write(self.prometheus())
+        os.replace(tmp_path, self.prometheus_path)
+
+    def _write_periodically(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write_prometheus()
+            except OSError as err:
+                print(f"Metrics file error: {err}")
+
+    def summary(self):
+        """
+        Returns the table of the stages: count, p50/p95/p99 latency, throughput and bytes
+        """
+        if not self.enabled:
+            return ''
+        elapsed = time.time() - self.started if self.started else 0
+        rows = []
+        with self.lock:
+            for name, stage in sorted(self.stages.items()):
+                q = stage.quantiles()
+                rate = stage.count / elapsed if elapsed else 0
+                rows.append(f"{name}: {stage.count} ({stage.failed} failed), "
+                            f"p50 {q[0.5] * 1000:.1f} ms, p95 {q[0.95] * 1000:.1f} ms, p99 {q[0.99] * 1000:.1f} ms, "
+                            f"{rate:.1f}/s, {stage.bytes / 1024 / 1024:.1f} MB")
+            rows += [f"{name}: {value}" for name, value in sorted(self.counters.items())]
+        return '\n'.join(rows)
+
+    def close(self):
+        """
+        Writes the final metrics and closes the log
+        """
+        if not self.enabled:
+            return
+        self.write_prometheus()
+        with self.lock:
+            if self.log_file:
+                self.log_file.close()
+                self.log_file = None
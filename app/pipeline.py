@@ -0,0 +1,119 @@
+import queue
+import threading
+
+
+_DONE = object()  # end-of-stream marker passed between stages
+
+
+class Stage:
+    """
+    One step of the pipeline (reading, signing, uploading...)
+    "func" is called with a job (dict) and fills the job with its results,
+    "workers" threads run it, jobs wait for them in a queue of "queue_size" items
+    """
+    def __init__(self, name, func, workers=1, queue_size=10):
+        assert(workers > 0), f"Stage '{name}' needs at least one worker"
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue_size = queue_size
+
+
+def _put(q, item, stop):
+    """
+    Puts the item into the bounded queue, gives up if the pipeline is stopped
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    """
+    Takes the next item from the queue, returns _DONE if the pipeline is stopped
+    """
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def run_pipeline(jobs, stages, stop=None):
+    """
+    Runs every job (dict) through the stages, each stage in its own threads,
+    so stage N+1 of one job overlaps stage N of the next one
+    If a stage raises, the exception is saved in job["error"] and the job skips the remaining stages,
+    a stage can also set job["skipped"] to pass the job straight to the output
+    Yields the jobs in the order they are finished; if "jobs" raises, the jobs already taken are finished
+    and the exception is raised here, in the caller's thread
+    "stop" (threading.Event) stops all the stages, it is also set when the caller stops iterating
+    """
+    stop = stop or threading.Event()
+    # queues[i] feeds stages[i], the last one collects finished jobs
+    queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+    queues.append(queue.Queue(maxsize=stages[-1].queue_size))
+    # number of workers of every stage which haven't finished yet
+    running = [stage.workers for stage in stages]
+    lock = threading.Lock()
+    feed_errors = []   # the exception of "jobs" iterator
+
+    def feed():
+        try:
+            for job in jobs:
+                job.setdefault('error', None)
+                if not _put(queues[0], job, stop):
+                    return
+        except Exception as err:
+            feed_errors.append(err)
+        # the stages finish without waiting for more jobs even if "jobs" has failed
+        for _ in range(stages[0].workers):
+            _put(queues[0], _DONE, stop)
+
+    def work(i):
+        stage = stages[i]
+        while True:
+            job = _get(queues[i], stop)
+            if job is _DONE:
+                break
+            # failed and skipped jobs are passed straight to the output
+            if job['error'] is None and not job.get('skipped'):
+                try:
+                    stage.func(job)
+                except Exception as err:
+                    job['error'] = err
+                    job['stage'] = stage.name
+            if not _put(queues[i + 1], job, stop):
+                return
+        # the last worker of the stage tells the next stage that there will be no more jobs
+        with lock:
+            running[i] -= 1
+            last = running[i] == 0
+        if last:
+            consumers = stages[i + 1].workers if i + 1 < len(stages) else 1
+            for _ in range(consumers):
+                _put(queues[i + 1], _DONE, stop)
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    for i, stage in enumerate(stages):
+        for n in range(stage.workers):
+            threads.append(threading.Thread(target=work, args=(i,), name=f"{stage.name}-{n}", daemon=True))
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            job = _get(queues[-1], stop)
+            if job is _DONE:
+                break
+            yield job
+        if feed_errors:
+            raise feed_errors[0]
+    finally:
+        # stops the threads if the caller stopped iterating before the end
+        stop.set()
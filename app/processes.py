@@ -0,0 +1,13 @@
+import multiprocessing
+
+
+def process_context():
+    """
+    Returns the multiprocessing context of the worker processes (signing, validation)
+    The workers aren't forked from the loader, whose threads may hold locks at the fork:
+    they are started by the fork server where there is one, as new interpreters elsewhere
+    (importing the modules has no side effects, the configured functions are passed to the workers)
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
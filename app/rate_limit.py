@@ -0,0 +1,120 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """
+    Token bucket for one API endpoint: lets through "rate" requests per second (+ "burst" at once),
+    counting the time passed since the previous request instead of sleeping a fixed interval
+    The rate is halved on 429/503 responses (down to "min_rate"), once per cooldown: the responses to the requests
+    already in flight don't halve it again until the block of Retry-After and one interval at the new rate have passed
+    The rate grows by "step" share of itself (not less than "min_rate") on every healthy response (up to "max_rate")
+    """
+    def __init__(self, rate, max_rate=None, min_rate=0.1, step=0.1, burst=1):
+        self.rate = rate
+        self.max_rate = max_rate or rate
+        self.min_rate = min_rate
+        self.step = step
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0   # set by Retry-After header
+        self.cooldown_until = 0   # the rate isn't halved again before this time
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        """
+        Adds tokens for the time passed since the last refill
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Blocks until the request is allowed
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.blocked_until:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.blocked_until - now
+            time.sleep(wait)
+
+    def slow_down(self, retry_after=None):
+        """
+        Halves the rate (unless it has been halved just now), stops all requests for "retry_after" seconds if given
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now >= self.cooldown_until:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.cooldown_until = max(self.blocked_until, now + (retry_after or 0)) + 1 / self.rate
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+                # no tokens are saved up while blocked
+                self.tokens = 0
+                self.updated = self.blocked_until
+
+    def speed_up(self):
+        """
+        Raises the rate by one step (proportional to the rate), not higher than the ceiling
+        """
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + max(self.min_rate, self.rate * self.step))
+
+
+def retry_after_seconds(response):
+    """
+    Returns the number of seconds from the Retry-After header of the response (or None)
+    The header is either a number of seconds or an HTTP date
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Separate token buckets for every API endpoint ("auth", "token", "documents/send"...)
+    limits: {endpoint: {"rate": ..., "max_rate": ...}} - keyword arguments of TokenBucket
+    metrics - MetricsCollector which gets the waiting times ("wait <endpoint>" stages)
+    """
+    def __init__(self, limits, metrics=None):
+        self.buckets = {endpoint: TokenBucket(**params) for endpoint, params in limits.items()}
+        self.metrics = metrics
+
+    def acquire(self, endpoint):
+        """
+        Blocks until a request to the endpoint is allowed
+        """
+        if self.metrics is None:
+            self.buckets[endpoint].acquire()
+            return
+        with self.metrics.measure(f"wait {endpoint}"):
+            self.buckets[endpoint].acquire()
+
+    def update(self, endpoint, response):
+        """
+        Adapts the rate of the endpoint to its response
+        """
+        bucket = self.buckets[endpoint]
+        retry_after = retry_after_seconds(response)
+        if response.status_code in (429, 503) or retry_after:
+            bucket.slow_down(retry_after)
+        elif response.status_code < 400:
+            bucket.speed_up()
@@ -0,0 +1,76 @@
+import heapq
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from retry import classify_error, PERMANENT
+
+
+# final processing statuses of MDLP documents
+PROCESSED_STATUSES = ('PROCESSED_DOCUMENT', 'SUCCESS_RESULT_READY')
+FAILED_STATUSES = ('FAILED', 'FAILED_RESULT_READY')
+
+
+class StatusReconciler:
+    """
+    Polls processing statuses of many uploaded documents at once with "workers" threads
+    "fetch_status"(document_id) - returns the status of the document (rate limiting is its business)
+    Every document is polled right away, then "first_delay" seconds later, then the delay grows "backoff" times
+    up to "max_delay"; polls failed with transient errors are repeated the same way
+    The document is given up after "timeout" seconds (its last status and error are reported)
+    """
+    def __init__(self, fetch_status, workers=4, first_delay=2.0, backoff=1.5, max_delay=60.0, timeout=3600.0):
+        self.fetch_status = fetch_status
+        self.workers = workers
+        self.first_delay = first_delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.timeout = timeout
+
+    def run(self, documents, stop=None):
+        """
+        documents - iterable of dicts with "document_id" key
+        Yields (document, status, error) when the status of the document is final, the poll has failed
+        with a permanent error (4xx) or the time is out (the last status and the error of the last poll)
+        """
+        start = time.monotonic()
+        numbers = itertools.count()
+        # heap of (poll time, number, document, delay)
+        waiting = [(start, next(numbers), document, self.first_delay) for document in documents]
+        heapq.heapify(waiting)
+        polling = {}   # future: (document, delay)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='status') as executor:
+            while waiting or polling:
+                if stop and stop.is_set():
+                    break
+                # polls of the documents whose time has come
+                now = time.monotonic()
+                while waiting and waiting[0][0] <= now and len(polling) < self.workers:
+                    _, _, document, delay = heapq.heappop(waiting)
+                    polling[executor.submit(self.fetch_status, document['document_id'])] = (document, delay)
+                if not polling:
+                    time.sleep(max(0.0, waiting[0][0] - time.monotonic()))
+                    continue
+                # waits for a poll to finish or for the next document to be due (if a worker is free)
+                timeout = None
+                if waiting and len(polling) < self.workers:
+                    timeout = max(0.0, waiting[0][0] - time.monotonic())
+                done, _ = wait(polling, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    document, delay = polling.pop(future)
+                    try:
+                        status = future.result()
+                        error = None
+                        final = status in PROCESSED_STATUSES or status in FAILED_STATUSES
+                    except Exception as err:
+                        status = document.get('status')
+                        error = err
+                        final = classify_error(err) == PERMANENT
+                    document['status'] = status
+                    if final or time.monotonic() - start >= self.timeout:
+                        yield document, status, error
+                    else:
+                        # frequent polls at first, then more and more rare
+                        heapq.heappush(waiting, (time.monotonic() + delay, next(numbers), document,
+                                                 min(self.max_delay, delay * self.backoff)))
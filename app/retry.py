@@ -0,0 +1,165 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+import requests
+
+from rate_limit import retry_after_seconds
+from streaming_body import DocumentChanged
+
+
+PERMANENT = 'permanent'   # the document itself is rejected (4xx), retrying won't help
+AUTH = 'auth'   # the session key(token) is rejected (401), retried with a new one
+TRANSIENT = 'transient'   # timeouts, connection errors, 5xx, 429 - retried after a delay
+
+TRANSIENT_STATUSES = (408, 425, 429)
+
+
+def classify_error(error):
+    """
+    Returns the kind of the error raised while loading a file: PERMANENT, AUTH or TRANSIENT
+    """
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        if status == 401:
+            return AUTH
+        if status >= 500 or status in TRANSIENT_STATUSES:
+            return TRANSIENT
+        return PERMANENT
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                          requests.exceptions.ChunkedEncodingError)):
+        return TRANSIENT
+    # the file was being rewritten, the next attempt reads and signs it again
+    if isinstance(error, DocumentChanged):
+        return TRANSIENT
+    return PERMANENT
+
+
+class RetryScheduler:
+    """
+    Delayed retries of failed files within the run
+    Transient failures are retried after an exponential backoff with jitter
+    ("base_delay" * 2 ** (attempt - 1), up to "max_delay", not earlier than Retry-After),
+    auth failures right away, every file gets up to "max_attempts" attempts
+    jobs(source) yields the new jobs and the retries, done(job) is called with every finished job
+    """
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.delayed = []   # heap of (time, number, job)
+        self.numbers = itertools.count()
+        self.in_flight = 0   # jobs given out and not done yet
+        self.closed = False
+        self.fresh = None   # the next job of the source
+        self.exhausted = False
+        self.source_error = None
+        self.condition = threading.Condition()
+        self.stats = {TRANSIENT: 0, AUTH: 0, 'gave_up': 0}
+
+    def delay(self, job):
+        """
+        Returns the number of seconds before the next attempt of the failed job
+        """
+        if job['error_kind'] == AUTH:
+            return 0.0
+        backoff = min(self.max_delay, self.base_delay * 2 ** (job['attempt'] - 1))
+        delay = random.uniform(backoff / 2, backoff)   # jitter, so retries don't come all at once
+        response = getattr(job['error'], 'response', None)
+        retry_after = retry_after_seconds(response) if response is not None else None
+        return max(delay, retry_after or 0.0)
+
+    def done(self, job):
+        """
+        Takes the finished job, returns True if it is final (loaded, skipped or failed for good)
+        and False if it is scheduled for a retry
+        """
+        retry = False
+        if job['error'] is not None:
+            job['error_kind'] = classify_error(job['error'])
+            if job['error_kind'] != PERMANENT:
+                if job['attempt'] < self.max_attempts:
+                    retry = True
+                else:
+                    self.stats['gave_up'] += 1
+        with self.condition:
+            self.in_flight -= 1
+            if retry:
+                self.stats[job['error_kind']] += 1
+                heapq.heappush(self.delayed, (time.monotonic() + self.delay(job), next(self.numbers), job))
+            self.condition.notify_all()
+        return not retry
+
+    def _due(self):
+        """
+        Returns the retry whose time has come (None if there is no one)
+        """
+        if self.delayed and self.delayed[0][0] <= time.monotonic():
+            job = heapq.heappop(self.delayed)[2]
+            # a fresh job for the next attempt
+            return {'filename': job['filename'], 'path': job['path'], 'key': job['key'],
+                    'attempt': job['attempt'] + 1}
+        return None
+
+    def _read(self, source):
+        """
+        Takes the jobs of "source" one by one in its own thread
+        (the next path can take time to appear, retries are given out meanwhile)
+        """
+        try:
+            for job in source:
+                job.setdefault('attempt', 1)
+                with self.condition:
+                    while self.fresh is not None and not self.closed:
+                        self.condition.wait()
+                    if self.closed:
+                        return
+                    self.fresh = job
+                    self.condition.notify_all()
+        except Exception as err:
+            self.source_error = err
+        finally:
+            with self.condition:
+                self.exhausted = True
+                self.condition.notify_all()
+
+    def jobs(self, source):
+        """
+        Yields the jobs of "source" (with "attempt" set) mixed with the retries whose time has come,
+        after the end of "source" waits for the jobs in flight and the delayed retries
+        """
+        threading.Thread(target=self._read, args=(source,), name='retry-source', daemon=True).start()
+        while True:
+            with self.condition:
+                while True:
+                    if self.closed:
+                        return
+                    job = self._due()
+                    if job is None and self.fresh is not None:
+                        job, self.fresh = self.fresh, None
+                    if job is not None:
+                        self.in_flight += 1
+                        self.condition.notify_all()
+                        break
+                    if self.exhausted and not self.fresh and not self.delayed and not self.in_flight:
+                        if self.source_error:
+                            raise self.source_error
+                        return
+                    timeout = self.delayed[0][0] - time.monotonic() if self.delayed else None
+                    self.condition.wait(timeout)
+            yield job
+
+    def close(self):
+        """
+        Stops giving out jobs (the run is stopped)
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def summary(self):
+        with self.condition:
+            return (f"Retries: {self.stats[TRANSIENT]} after transient errors, {self.stats[AUTH]} after token renewal, "
+                    f"gave up on {self.stats['gave_up']} files after {self.max_attempts} attempts")
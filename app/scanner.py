@@ -0,0 +1,58 @@
+import os
+from fnmatch import fnmatch
+
+
+ORDERS = {
+    'name': lambda entry: entry.name,
+    'mtime': lambda entry: entry.stat().st_mtime,
+    'size': lambda entry: entry.stat().st_size,
+}
+
+
+def _matches(name, patterns):
+    return any(fnmatch(name, pattern) for pattern in patterns)
+
+
+def _entries(directory, include, exclude, recursive):
+    """
+    Yields os.DirEntry of files matching "include" and not "exclude" glob patterns
+    ("exclude" also skips subdirectories with matching names)
+    Directories are read one by one with os.scandir, so nothing is held in memory
+    """
+    with os.scandir(directory) as entries:
+        subdirectories = []
+        for entry in entries:
+            if _matches(entry.name, exclude):
+                continue
+            if entry.is_file():
+                if _matches(entry.name, include):
+                    yield entry
+            elif recursive and entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+    for subdirectory in subdirectories:
+        yield from _entries(subdirectory, include, exclude, recursive)
+
+
+def scan_directory(directory, include=('*.xml',), exclude=(), recursive=False, order=None):
+    """
+    Yields paths of the matching files of the directory as soon as they are found
+    order: None - the order of the file system (streaming), 'name', 'mtime' or 'size'
+    (sorting has to read the whole directory first)
+    """
+    entries = _entries(directory, include, exclude, recursive)
+    if order is None:
+        for entry in entries:
+            yield entry.path
+        return
+    assert(order in ORDERS), f"Unknown order '{order}', expected one of {tuple(ORDERS)}"
+    key = ORDERS[order]
+    # only paths and sort keys are kept
+    for _, path in sorted((key(entry), entry.path) for entry in entries):
+        yield path
+
+
+def count_files(directory, include=('*.xml',), exclude=(), recursive=False):
+    """
+    Returns the number of the matching files (file types are taken from the directory listing, no stat calls)
+    """
+    return sum(1 for _ in _entries(directory, include, exclude, recursive))
@@ -0,0 +1,152 @@
+import argparse
+import ast
+import json
+import os
+import threading
+
+
+# kinds of values which are settings (module constants, classes and objects made of them are not)
+_SETTING_TYPES = (str, int, float, bool, dict, list, tuple, type(None))
+
+
+def parse_value(text):
+    """
+    Returns the value of a setting written as a python literal, or the text itself if it isn't one
+    (so paths and names may be written without quotes)
+    """
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+class Settings:
+    """
+    Settings of the loaders: the UPPER_CASE global variables of the module are their defaults,
+    which are overridden (in this order) by the json file of "path", by environment variables
+    "env_prefix"<NAME> and by the command line (--set NAME=VALUE); values of the environment and of the command line
+    are python literals, dict settings are updated key by key (RETRY={'max_attempts': 3} changes only that key)
+    The overrides are applied to the module once, at the first load() (lazily, when something needs them)
+    "sources" - where every overridden setting comes from
+    """
+    def __init__(self, namespace, path='info/config.json', env_prefix='MDLP_'):
+        self.namespace = namespace
+        self.names = sorted(name for name, value in namespace.items()
+                            if name.isupper() and isinstance(value, _SETTING_TYPES))
+        self.path = path
+        self.env_prefix = env_prefix
+        self.sources = {}
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def apply(self, name, value, source):
+        """
+        Sets the setting of the module (dicts are updated in place, so the modules which imported them see it)
+        """
+        if name not in self.names:
+            raise ValueError(f"Unknown setting {name} ({source})")
+        current = self.namespace[name]
+        if isinstance(current, dict):
+            if not isinstance(value, dict):
+                raise ValueError(f"Setting {name} ({source}) must be a dict, not {value!r}")
+            current.update(value)
+        else:
+            self.namespace[name] = value
+        self.sources[name] = source
+
+    def convert(self, name, text):
+        """
+        Returns the value of the setting written in the environment or in the command line
+        (text settings keep the text as it is: CERT_PIN=0123 stays a string)
+        """
+        value = parse_value(text)
+        if isinstance(self.namespace.get(name), str) and not isinstance(value, str):
+            return text
+        return value
+
+    def read_file(self, path):
+        """
+        Returns the settings of the json file ({} if there is no such file)
+        """
+        try:
+            with open(path, 'r') as file:
+                values = json.load(file)
+        except FileNotFoundError:
+            return {}
+        if not isinstance(values, dict):
+            raise ValueError(f"Settings file {path} must contain a json object")
+        return values
+
+    def load(self, path=None, overrides=()):
+        """
+        Applies the settings of the file ("path" or the one given with <prefix>CONFIG environment variable),
+        of the environment and "overrides" - (name, text of the value) pairs of the command line
+        Does nothing if the settings are loaded already (and fails if they would be changed)
+        """
+        with self.lock:
+            if self.loaded:
+                if path or overrides:
+                    raise RuntimeError("Settings are loaded already, they can't be changed")
+                return
+            path = path or os.environ.get(f"{self.env_prefix}CONFIG") or self.path
+            for name, value in self.read_file(path).items():
+                self.apply(name, value, path)
+            for name in self.names:
+                variable = self.env_prefix + name
+                if variable in os.environ:
+                    self.apply(name, self.convert(name, os.environ[variable]), variable)
+            for name, text in overrides:
+                self.apply(name, self.convert(name, text), 'command line')
+            self.loaded = True
+
+    def overridden(self):
+        """
+        Returns {name: value} of the settings which have been overridden (for the worker processes)
+        """
+        with self.lock:
+            return {name: self.namespace[name] for name in self.sources}
+
+    def restore(self, values, source='loader process'):
+        """
+        Applies the settings overridden in the loader ("values" of overridden()) instead of loading them:
+        worker processes started by spawn or the fork server import the module with its defaults
+        """
+        with self.lock:
+            for name, value in values.items():
+                self.apply(name, value, source)
+            self.loaded = True
+
+    def parse_args(self, argv, description=None, extra_args=False):
+        """
+        Loads the settings with the command line arguments:
+        --config PATH (settings file), --set NAME=VALUE (repeated), --xml-dir DIR (PATH_TO_DIRECTORY_WITH_XML)
+        Returns the other arguments if "extra_args" (they are an error otherwise)
+        """
+        parser = argparse.ArgumentParser(description=description)
+        parser.add_argument('--config', help=f"json file of settings (default {self.path})")
+        parser.add_argument('--set', dest='overrides', type=setting, action='append', default=[],
+                            metavar='NAME=VALUE', help="setting (python literal), e.g. --set ASYNC_UPLOADS=20")
+        parser.add_argument('--xml-dir', help="directory with xml files (PATH_TO_DIRECTORY_WITH_XML)")
+        if extra_args:
+            args, rest = parser.parse_known_args(argv)
+        else:
+            args, rest = parser.parse_args(argv), []
+        overrides = list(args.overrides)
+        if args.xml_dir is not None:
+            overrides.append(('PATH_TO_DIRECTORY_WITH_XML', args.xml_dir))
+        self.load(args.config, overrides)
+        return rest
+
+    def summary(self):
+        return "Settings: " + (', '.join(f"{name} from {source}" for name, source in sorted(self.sources.items()))
+                               or "defaults")
+
+
+def setting(text):
+    """
+    Returns (name, text of the value) of "NAME=VALUE" argument
+    """
+    name, separator, value = text.partition('=')
+    if not separator or not name.strip():
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {text!r}")
+    return name.strip(), value.strip()
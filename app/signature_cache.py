@@ -0,0 +1,94 @@
+import sqlite3
+import threading
+import time
+
+
+class SignatureCache:
+    """
+    SQLite cache of detached signatures, keyed by sha256 of the document + certificate thumbprint + signing options,
+    so an unchanged document is signed once (a new certificate doesn't match the entries of the old one)
+    Holds up to "max_entries" signatures (the least recently used ones are evicted)
+    not older than "max_age" seconds (None - no limits)
+    Counts hits and misses
+    """
+    def __init__(self, path='info/signatures.sqlite3', max_entries=20000, max_age=30 * 24 * 3600):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS signatures ('
+            ' hash TEXT NOT NULL,'
+            ' thumbprint TEXT NOT NULL,'
+            ' options TEXT NOT NULL,'
+            ' signature TEXT NOT NULL,'
+            ' created REAL NOT NULL,'
+            ' used REAL NOT NULL,'
+            ' PRIMARY KEY (hash, thumbprint, options))'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS signatures_used ON signatures (used)')
+        self.connection.commit()
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        with self.lock:
+            self._evict()
+
+    def _evict(self):
+        """
+        Deletes expired entries and the least recently used ones above "max_entries"
+        """
+        if self.max_age is not None:
+            self.connection.execute('DELETE FROM signatures WHERE created < ?', (time.time() - self.max_age,))
+        if self.max_entries is not None:
+            self.connection.execute(
+                'DELETE FROM signatures WHERE rowid IN '
+                '(SELECT rowid FROM signatures ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+        self.connection.commit()
+
+    def get(self, digest, thumbprint, options):
+        """
+        Returns the cached signature (None if there is no valid one)
+        """
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT signature, created FROM signatures WHERE hash = ? AND thumbprint = ? AND options = ?',
+                (digest, thumbprint, options)).fetchone()
+            if row is None or (self.max_age is not None and row[1] < now - self.max_age):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute('UPDATE signatures SET used = ? WHERE hash = ? AND thumbprint = ? AND options = ?',
+                                    (now, digest, thumbprint, options))
+            self.connection.commit()
+        return row[0]
+
+    def put(self, digest, thumbprint, options, signature):
+        """
+        Saves the signature made successfully
+        """
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO signatures (hash, thumbprint, options, signature, created, used) '
+                'VALUES (?, ?, ?, ?, ?, ?)', (digest, thumbprint, options, signature, now, now))
+            self.connection.commit()
+            if self.max_entries is not None and \
+                    self.connection.execute('SELECT COUNT(*) FROM signatures').fetchone()[0] > self.max_entries:
+                self._evict()
+
+    def summary(self):
+        """
+        Returns the string with hit and miss counters
+        """
+        with self.lock:
+            total = self.hits + self.misses
+            ratio = self.hits / total * 100 if total else 0
+            return f"Signature cache: {self.hits} hits, {self.misses} misses ({ratio:.0f}% hit rate)"
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
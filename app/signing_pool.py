@@ -0,0 +1,94 @@
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from processes import process_context
+
+
+# configured signer of the worker process, created once at its start
+_signer = None
+_sign = None
+_verify = None
+
+
+def _init_worker(setup, create_signer, sign, verify):
+    """
+    Runs once in every worker process: applies the settings of the loader ("setup"), loads the certificate
+    and configures the signer
+    """
+    global _signer, _sign, _verify
+    if setup:
+        setup()
+    _signer = create_signer()
+    _sign = sign
+    _verify = verify
+
+
+def _sign_in_worker(document, verify):
+    """
+    Signs the document with the signer of the worker process (and verifies the signature if "verify")
+    Returns signature, signing time, verification time (or None) and verification error (or None)
+    """
+    start = time.perf_counter()
+    signature = _sign(_signer, document)
+    sign_time = time.perf_counter() - start
+
+    verify_time = verify_error = None
+    if verify:
+        start = time.perf_counter()
+        try:
+            _verify(document, signature)
+        except Exception as err:
+            verify_error = str(err)
+        verify_time = time.perf_counter() - start
+
+    return signature, sign_time, verify_time, verify_error
+
+
+class SigningPool:
+    """
+    Signs documents in "workers" processes, every one of them keeps its own certificate and signer
+    create_signer() - returns the configured signer (runs once in every worker)
+    sign(signer, document) - returns the detached signature of the document (base64 string or another picklable object)
+    verify(document, signature) - raises if the signature is invalid
+    verifier - SignatureVerifier which decides what to verify and counts the time
+    setup() - runs first in every worker (applies the settings of the loader)
+    """
+    def __init__(self, workers, create_signer, sign, verify, verifier, setup=None):
+        self.verifier = verifier
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=process_context(),
+                                            initializer=_init_worker, initargs=(setup, create_signer, sign, verify))
+
+    def submit(self, document, name=None, on_valid=None, on_invalid=None):
+        """
+        Sends the document to a worker process
+        Returns the future of the signature (base64 string without "\\n")
+        "on_valid"(signature) - called when the verifier accepts the signature (now or after background verification),
+        "on_invalid"(error) - when its background verification fails
+        """
+        result = Future()
+        verify_now = self.verifier.verify_now(name)
+
+        def done(future):
+            try:
+                signature, sign_time, verify_time, verify_error = future.result()
+            except Exception as err:
+                result.set_exception(err)
+                return
+            self.verifier.add_signing(sign_time)
+            if verify_time is not None:
+                self.verifier.add_verification(verify_time, failed=bool(verify_error))
+            if verify_error:
+                result.set_exception(RuntimeError(f"Signature verification failed: {verify_error}"))
+                return
+            if not verify_now:
+                self.verifier.check_later(document, signature, name, on_valid, on_invalid)
+            elif on_valid:
+                on_valid(signature)
+            result.set_result(''.join(signature.splitlines()))   # \n delition
+
+        self.executor.submit(_sign_in_worker, document, verify_now).add_done_callback(done)
+
+        return result
+
+    def shutdown(self):
+        self.executor.shutdown()
@@ -0,0 +1,100 @@
+import base64
+import hashlib
+import json
+
+from archives import open_document, document_size
+
+
+CHUNK_SIZE = 3 * 64 * 1024   # bytes of the file read at once (a multiple of 3, so chunks are encoded without padding)
+
+
+def base64_length(size):
+    """
+    Returns the length of base64 string of "size" bytes
+    """
+    return (size + 2) // 3 * 4
+
+
+class DocumentChanged(Exception):
+    """
+    The file has been changed after it was signed
+    """
+
+
+def file_chunks(path, size, chunk_size=CHUNK_SIZE, digest=None):
+    """
+    Yields the chunks of the file, not more than "size" bytes (the size it had when it was signed)
+    The last chunk is held back until the whole file is checked: if the size or sha256 hex "digest" of the file
+    differs, DocumentChanged is raised instead of it, so the request never gets all the bytes it promises
+    """
+    sha256 = hashlib.sha256()
+    read = 0
+    last = None
+    with open_document(path) as file:
+        # not more than Content-Length promises
+        while read < size:
+            chunk = file.read(min(chunk_size, size - read))
+            if not chunk:
+                break
+            sha256.update(chunk)
+            read += len(chunk)
+            if last is not None:
+                yield last
+            last = chunk
+        changed = read != size or file.read(1) != b''
+    if changed or (digest and sha256.hexdigest() != digest):
+        raise DocumentChanged(f"{path} has changed since it was signed")
+    if last is not None:
+        yield last
+
+
+class DocumentBody:
+    """
+    Json body of documents/send request which is written while it is sent:
+    the document is read from "path" and encoded into base64 chunk by chunk, so only one chunk is in memory
+    The length is known beforehand (len()), so the request is sent with Content-Length
+    If "digest" (sha256 hex digest of the signed file) is given and the file has changed since the signing,
+    the body is broken off before its end and DocumentChanged is raised
+    The body can be iterated again (request retries)
+    """
+    def __init__(self, path, signature, request_id, digest=None, bulk_processing='false', chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.digest = digest
+        self.chunk_size = chunk_size - chunk_size % 3 or 3
+        self.size = document_size(path)
+        # the same fields in the same order as json.dumps of the whole payload
+        self.prefix = b'{"document": "'
+        rest = json.dumps({
+            "sign": signature,   # signed document as base64 format string
+            "request_id": request_id,
+            "bulk_processing": bulk_processing
+        })
+        self.suffix = ('", ' + rest[1:]).encode('utf-8')
+
+    def __len__(self):
+        return len(self.prefix) + base64_length(self.size) + len(self.suffix)
+
+    def __iter__(self):
+        yield self.prefix
+        for chunk in file_chunks(self.path, self.size, self.chunk_size, self.digest):
+            yield base64.b64encode(chunk)
+        yield self.suffix
+
+
+class FileBody:
+    """
+    The file as it is on disk, read chunk by chunk while it is sent (upload of large documents)
+    Like DocumentBody, it has len() and is broken off with DocumentChanged (before its last chunk)
+    if the file has changed
+    """
+    def __init__(self, path, digest=None, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.digest = digest
+        self.chunk_size = chunk_size
+        self.size = document_size(path)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return file_chunks(self.path, self.size, self.chunk_size, self.digest)
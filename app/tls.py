@@ -0,0 +1,136 @@
+import socket
+import ssl
+import threading
+
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPSConnectionPool
+
+
+class TLSStats:
+    """
+    Counters of TLS handshakes and of connection reuse
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.full_handshakes = 0
+        self.resumed_handshakes = 0
+        self.connections = 0
+        self.requests = 0
+        self.reused = 0   # requests sent over an already used connection
+        self.max_requests_per_connection = 0
+
+    def add_handshake(self, resumed):
+        with self.lock:
+            if resumed:
+                self.resumed_handshakes += 1
+            else:
+                self.full_handshakes += 1
+
+    def add_connection(self):
+        with self.lock:
+            self.connections += 1
+
+    def add_request(self, number_on_connection):
+        """
+        Counts the request, which is "number_on_connection"-th one sent over its connection
+        """
+        with self.lock:
+            self.requests += 1
+            if number_on_connection > 1:
+                self.reused += 1
+            self.max_requests_per_connection = max(self.max_requests_per_connection, number_on_connection)
+
+    def summary(self):
+        with self.lock:
+            per_connection = self.requests / self.connections if self.connections else 0
+            return (f"TLS: {self.full_handshakes} full and {self.resumed_handshakes} resumed handshakes, "
+                    f"{self.connections} connections, {self.requests} requests ({self.reused} over reused connections, "
+                    f"{per_connection:.1f} per connection, max {self.max_requests_per_connection})")
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """
+    SSL context shared by all connections of an adapter: offers the TLS session of the previous connection
+    to the same host, so a reconnect makes a short (resumed) handshake instead of a full one
+    """
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT, stats=None):
+        self.stats = stats or TLSStats()
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+
+    def save_session(self, server_hostname, sock):
+        """
+        Keeps the session of the socket for the next connections to the host
+        """
+        session = getattr(sock, 'session', None)
+        if session is not None:
+            with self.sessions_lock:
+                self.sessions[server_hostname] = session
+
+    def wrap_socket(self, sock, *args, server_hostname=None, session=None, **kwargs):
+        if session is None:
+            with self.sessions_lock:
+                session = self.sessions.get(server_hostname)
+        tls_sock = super().wrap_socket(sock, *args, server_hostname=server_hostname, session=session, **kwargs)
+        self.stats.add_handshake(tls_sock.session_reused)
+        self.save_session(server_hostname, tls_sock)
+        return tls_sock
+
+
+def create_resuming_context(ciphers, stats=None):
+    """
+    Returns ResumingSSLContext with the ciphers (TLS 1.2+, certificate and host name are verified)
+    """
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT, stats)
+    context.set_ciphers(ciphers)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.options |= ssl.OP_NO_COMPRESSION
+
+    return context
+
+
+def keep_alive_socket_options(idle):
+    """
+    Returns socket options of urllib3 connections with TCP keep-alive probes after "idle" seconds (0 - default options)
+    """
+    options = list(HTTPConnection.default_socket_options)
+    if idle:
+        options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle))
+    return options
+
+
+class CountingHTTPSConnection(HTTPSConnection):
+    """
+    HTTPS connection which counts its requests in the stats of its ResumingSSLContext
+    """
+    requests_sent = 0
+
+    def _stats(self):
+        return getattr(self.ssl_context, 'stats', None)
+
+    def connect(self):
+        super().connect()
+        # the count starts again on every new socket (urllib3 reconnects the same connection object)
+        self.requests_sent = 0
+        if self._stats():
+            self._stats().add_connection()
+
+    def request(self, *args, **kwargs):
+        # counted when it has been sent, so a connect made by the request itself is before the count
+        result = super().request(*args, **kwargs)
+        self.requests_sent += 1
+        if self._stats():
+            self._stats().add_request(self.requests_sent)
+        return result
+
+    def close(self):
+        # the latest session (TLS 1.3 tickets come after the handshake)
+        if self.sock is not None and isinstance(self.ssl_context, ResumingSSLContext):
+            self.ssl_context.save_session(self.host, self.sock)
+        super().close()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = CountingHTTPSConnection
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl   # file locks between processes (Linux)
+except ImportError:
+    fcntl = None
+
+
+REFRESH_MARGIN = 5 * 60   # the token is renewed this number of seconds before it expires
+RETRY_INTERVAL = 30   # seconds between attempts if the background renewal has failed
+
+
+class _FileLock:
+    """
+    Exclusive lock of "path" file shared by all processes (does nothing without fcntl)
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        if fcntl:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+class TokenManager:
+    """
+    Keeps a valid session key(token)
+    "receive" - function which makes authentication + code signing + authorization requests
+    and returns the authorization response json: {"token": ..., "life_time": <minutes>}
+    The token is renewed in a background thread before it expires
+    and saved in "cache_path" file, so other processes (load_unloaded.py, the app, parallel runs)
+    with the same "user_id" reuse it instead of a new authorization
+    """
+    def __init__(self, receive, cache_path='info/token.json', user_id='', refresh_margin=REFRESH_MARGIN):
+        self.receive = receive
+        self.cache_path = cache_path
+        self.user_id = user_id
+        self.refresh_margin = refresh_margin
+        self.token = None
+        self.expires_at = 0
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def _margin(self, life_time):
+        """
+        Renewal margin, not more than a half of the token life time
+        """
+        return min(self.refresh_margin, life_time / 2)
+
+    def _read_cache(self):
+        """
+        Returns (token, expires_at, life_time) saved in the cache file for the user or None
+        """
+        try:
+            with open(self.cache_path, 'r') as file:
+                cached = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if cached.get('user_id') != self.user_id:
+            return None
+        return cached['token'], cached['expires_at'], cached['life_time']
+
+    def _write_cache(self, token, expires_at, life_time):
+        """
+        Saves the token into the cache file (readable only by the owner)
+        """
+        tmp_path = self.cache_path + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as file:
+            json.dump({'user_id': self.user_id, 'token': token,
+                       'expires_at': expires_at, 'life_time': life_time}, file)
+        os.replace(tmp_path, self.cache_path)
+
+    def refresh(self):
+        """
+        Takes the token from the cache if another process has renewed it, otherwise receives a new one
+        Raises the exceptions of the requests
+        """
+        with _FileLock(self.cache_path + '.lock'):
+            cached = self._read_cache()
+            if cached and cached[1] - self._margin(cached[2]) > time.time():
+                token, expires_at, life_time = cached
+            else:
+                response = self.receive()
+                token = response['token']
+                life_time = response['life_time'] * 60
+                expires_at = time.time() + life_time
+                self._write_cache(token, expires_at, life_time)
+
+        with self.lock:
+            self.token = token
+            self.expires_at = expires_at
+        self._schedule(expires_at - self._margin(life_time) - time.time())
+
+        return token
+
+    def _schedule(self, delay):
+        """
+        Starts the timer of the background renewal
+        """
+        if self.timer:
+            self.timer.cancel()
+        self.timer = threading.Timer(max(0, delay), self._refresh_in_background)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as err:
+            print("Token renewal error")
+            print(err)
+            # tries again while the old token is still valid
+            if self.expires_at > time.time():
+                self._schedule(RETRY_INTERVAL)
+
+    def invalidate(self, token):
+        """
+        Forgets the token rejected by the API (401), so the next get() receives a new one
+        Does nothing if the token has already been replaced
+        """
+        with _FileLock(self.cache_path + '.lock'):
+            cached = self._read_cache()
+            if cached and cached[0] == token:
+                os.remove(self.cache_path)
+        with self.lock:
+            if self.token == token:
+                self.token = None
+
+    def get(self):
+        """
+        Returns the valid token, receives it only if there is no valid one yet
+        """
+        with self.lock:
+            if self.token and self.expires_at > time.time():
+                return self.token
+
+        return self.refresh()
+
+    def stop(self):
+        """
+        Stops the background renewal
+        """
+        if self.timer:
+            self.timer.cancel()
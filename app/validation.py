@@ -0,0 +1,125 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from xml.etree import ElementTree
+
+from archives import open_document
+from processes import process_context
+
+try:
+    from lxml import etree   # only for validation against XSD schemas
+except ImportError:
+    etree = None
+
+
+ROOT_ELEMENT = 'documents'   # root element of MDLP documents
+
+
+class InvalidDocument(Exception):
+    """
+    The xml document is malformed or doesn't match the schema
+    """
+
+
+# schema of the process, loaded once at its start
+_schema = None
+
+
+def _local_name(tag):
+    return tag.rpartition('}')[2]
+
+
+def load_schema(path):
+    """
+    Returns lxml XMLSchema from the xsd file (it can include the other schemas of its folder)
+    """
+    assert(etree is not None), "lxml is needed for validation against XSD schemas (pip install lxml)"
+    return etree.XMLSchema(etree.parse(path))
+
+
+def check_document(path, schema=None):
+    """
+    Checks that the xml file is well-formed, its root element is "documents"
+    and the document element inside it has action_id attribute; validates the file against the schema if it is given
+    The file is parsed as a stream, parsed elements are dropped
+    Returns action_id, raises InvalidDocument
+    """
+    action_id = None
+    depth = 0
+    try:
+        with open_document(path) as file:
+            for event, element in ElementTree.iterparse(file, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if depth == 1 and _local_name(element.tag) != ROOT_ELEMENT:
+                        raise InvalidDocument(f"Root element is <{_local_name(element.tag)}>, expected <{ROOT_ELEMENT}>")
+                    if depth == 2 and action_id is None:
+                        action_id = element.get('action_id')
+                        if not action_id:
+                            raise InvalidDocument(f"<{_local_name(element.tag)}> has no action_id")
+                else:
+                    depth -= 1
+                    element.clear()
+    except ElementTree.ParseError as err:
+        raise InvalidDocument(f"Malformed xml: {err}")
+    if action_id is None:
+        raise InvalidDocument("There is no document inside <documents>")
+
+    if schema is not None:
+        with open_document(path) as file:
+            valid = schema.validate(etree.parse(file))
+        if not valid:
+            raise InvalidDocument(f"Schema validation failed: {schema.error_log.last_error}")
+
+    return action_id
+
+
+def _init_worker(setup, schema_path):
+    """
+    Runs once in every worker process: applies the settings of the loader ("setup"), loads the schema
+    """
+    global _schema
+    if setup:
+        setup()
+    _schema = load_schema(schema_path) if schema_path else None
+
+
+def _check_in_worker(path):
+    return check_document(path, _schema)
+
+
+class DocumentValidator:
+    """
+    Pre-flight check of xml documents before they are signed (check_document)
+    in "workers" processes (0 - in the calling thread), the schema is loaded once in every process
+    setup() - runs first in every worker process (applies the settings of the loader)
+    """
+    def __init__(self, workers=0, schema_path='', setup=None):
+        self.executor = None
+        self.schema = None
+        if workers:
+            self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=process_context(),
+                                                initializer=_init_worker, initargs=(setup, schema_path))
+        elif schema_path:
+            self.schema = load_schema(schema_path)
+
+    def submit(self, path):
+        """
+        Returns the future of action_id of the document (InvalidDocument if it is invalid)
+        """
+        if self.executor:
+            return self.executor.submit(_check_in_worker, path)
+        result = Future()
+        try:
+            result.set_result(check_document(path, self.schema))
+        except Exception as err:
+            result.set_exception(err)
+        return result
+
+    def check(self, path):
+        """
+        Returns action_id of the document, raises InvalidDocument
+        """
+        return self.submit(path).result()
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown()
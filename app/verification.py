@@ -0,0 +1,148 @@
+import queue
+import threading
+import time
+
+
+MODES = ('always', 'sampled', 'async', 'off')
+
+
+class SignatureVerifier:
+    """
+    Self-verification of just made signatures
+    "verify" - function(content_base64, signature) which raises if the signature is invalid
+    Modes:
+        'always' - every signature is verified before it is returned
+        'sampled' - the first document of the run and then every "sample_rate"-th one
+                    (signatures of auth codes are always verified)
+        'async' - document signatures are verified in a background thread,
+                  "on_failure"(name, error) is called for invalid ones
+        'off' - no verification
+    A signature is accepted (its "on_valid"(signature) is called) when it has been verified,
+    right away in 'off' mode; the signatures 'sampled' mode skips are never accepted;
+    "on_invalid"(error) of the signature is called if its background verification fails
+    Counts the number and the time of signings and verifications for the mode
+    (and passes them to "metrics" MetricsCollector as "sign" and "verify" stages if it is given)
+    """
+    def __init__(self, verify, mode='always', sample_rate=100, on_failure=None, metrics=None):
+        assert(mode in MODES), f"Unknown verification mode '{mode}', expected one of {MODES}"
+        self.verify = verify
+        self.mode = mode
+        self.sample_rate = max(1, sample_rate)
+        self.on_failure = on_failure
+        self.metrics = metrics
+        self.stats = {'signed': 0, 'sign_time': 0.0, 'verified': 0, 'verify_time': 0.0, 'failed': 0}
+        self.lock = threading.Lock()
+        self.documents = 0   # number of checked document signatures (for 'sampled' mode)
+        self.queue = None
+        if mode == 'async':
+            self.queue = queue.Queue()
+            threading.Thread(target=self._work, name='verifier', daemon=True).start()
+
+    def add_signing(self, seconds):
+        """
+        Counts one signing which took "seconds"
+        """
+        with self.lock:
+            self.stats['signed'] += 1
+            self.stats['sign_time'] += seconds
+        if self.metrics:
+            self.metrics.observe('sign', seconds)
+
+    def add_verification(self, seconds, failed=False):
+        """
+        Counts one verification which took "seconds"
+        """
+        with self.lock:
+            self.stats['verified'] += 1
+            self.stats['verify_time'] += seconds
+            if failed:
+                self.stats['failed'] += 1
+        if self.metrics:
+            self.metrics.observe('verify', seconds, failed=failed)
+
+    def _verify(self, content, signature):
+        """
+        Verifies the signature and counts the time
+        """
+        start = time.perf_counter()
+        try:
+            self.verify(content, signature)
+        except Exception:
+            self.add_verification(time.perf_counter() - start, failed=True)
+            raise
+        self.add_verification(time.perf_counter() - start)
+
+    def verify_now(self, name=None):
+        """
+        Returns True if the signature of "name" file (None for auth codes) must be verified right away
+        """
+        if self.mode == 'always':
+            return True
+        if self.mode == 'sampled':
+            with self.lock:
+                number = self.documents
+                if name is not None:
+                    self.documents += 1
+            return name is None or number % self.sample_rate == 0
+        if self.mode == 'async':
+            return name is None
+        return False
+
+    def check_later(self, content, signature, name, on_valid=None, on_invalid=None):
+        """
+        Puts the signature into the queue of background verification ('async' mode only),
+        accepts it in 'off' mode
+        """
+        if self.queue:
+            self.queue.put((content, signature, name, on_valid, on_invalid))
+        elif self.mode == 'off' and on_valid:
+            on_valid(signature)
+
+    def check(self, content, signature, name=None, on_valid=None, on_invalid=None):
+        """
+        Verifies the signature of the content (base64) according to the mode
+        "name" - the file name (None for auth codes)
+        "on_valid"(signature) - called when the signature is accepted, "on_invalid"(error) - when its background
+        verification fails (a failure of the verification right away is raised)
+        """
+        if self.verify_now(name):
+            self._verify(content, signature)
+            if on_valid:
+                on_valid(signature)
+        else:
+            self.check_later(content, signature, name, on_valid, on_invalid)
+
+    def _work(self):
+        while True:
+            content, signature, name, on_valid, on_invalid = self.queue.get()
+            try:
+                self._verify(content, signature)
+            except Exception as err:
+                if self.on_failure:
+                    self.on_failure(name, f"Signature verification failed: {err}")
+                if on_invalid:
+                    on_invalid(err)
+            else:
+                if on_valid:
+                    on_valid(signature)
+            finally:
+                self.queue.task_done()
+
+    def wait(self):
+        """
+        Waits until all background verifications are done
+        """
+        if self.queue:
+            self.queue.join()
+
+    def summary(self):
+        """
+        Returns the string with the counters of the mode
+        """
+        with self.lock:
+            stats = dict(self.stats)
+        sign_rate = stats['signed'] / stats['sign_time'] if stats['sign_time'] else 0
+        total_rate = stats['signed'] / (stats['sign_time'] + stats['verify_time']) if stats['sign_time'] else 0
+        return (f"Verification mode '{self.mode}': signed {stats['signed']} in {stats['sign_time']:.2f} s, "
+                f"verified {stats['verified']} in {stats['verify_time']:.2f} s, failed {stats['failed']}, "
+                f"{sign_rate:.1f} signatures/s without verification, {total_rate:.1f} with it")
@@ -0,0 +1,117 @@
+import csv
+import requests
+import sys
+import os
+import threading
+import load_xml
+from load_xml import (configure,
+                      get_accounts, connect_account, upload_files,
+                      error_description, report_error,
+                      finish_run)
+from watcher import watch_directory
+
+
+MOVE_FINISHED_FILES = True  # moves uploaded files into "done" subfolder and failed ones into "failed" subfolder
+POLL_INTERVAL = 2  # seconds between directory scans if inotify isn't available
+
+
+def move_file(path, folder):
+    """
+    Moves the file into the subfolder (created if there is no one) of its directory
+    """
+    destination = os.path.join(os.path.dirname(path), folder)
+    os.makedirs(destination, exist_ok=True)
+    os.replace(path, os.path.join(destination, os.path.basename(path)))
+
+
+def main(argv=None):
+    # settings of info/config.json, the environment and the command line
+    configure(argv, "Uploads xml files of PATH_TO_DIRECTORY_WITH_XML as soon as they are written")
+    directory = load_xml.PATH_TO_DIRECTORY_WITH_XML
+    # accounts of info.csv or ACCOUNTS_PATH file,
+    # every one with its session, private certificate (from CryptoPro certmgr) and token manager
+    accounts = get_accounts()
+    for account in accounts:
+        connect_account(account)
+
+    # session keys(tokens) from the cache or from authentication and authorization requests,
+    # they are renewed in the background all the time the daemon works
+    try:
+        for account in accounts:
+            account.tokens.get()
+    except requests.exceptions.RequestException as err:
+        title, message = error_description(err)
+        print(title)
+        print(message)
+        sys.exit()
+
+    # the csv file for errors is kept between restarts of the daemon
+    if not os.path.exists('info/unloaded.csv'):
+        with open('info/unloaded.csv', 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=['filename', 'error'])
+            writer.writeheader()
+
+    # files which are being uploaded now (the same file can be reported by the watcher twice)
+    in_progress = set()
+
+    def new_files():
+        for path in watch_directory(directory, poll_interval=POLL_INTERVAL):
+            if path not in in_progress:
+                in_progress.add(path)
+                yield path
+
+    # a file whose signature is verified in the background (VERIFY_MODE 'async') is read again by the verification,
+    # it is moved when both its upload and the verification are finished, by the last of them
+    moves_lock = threading.Lock()
+
+    def finished(job, folder=None, verified=False, verify_error=None):
+        with moves_lock:
+            if folder:
+                job['folder'] = folder
+            if verified:
+                job['verifying'] = False
+                # uploaded, but with an invalid signature
+                job['verify_error'] = verify_error
+            if 'folder' not in job or job.get('verifying') or job.get('moved'):
+                return
+            job['moved'] = True
+        if MOVE_FINISHED_FILES and os.path.exists(job['path']):
+            try:
+                move_file(job['path'], 'failed' if job.get('verify_error') else job['folder'])
+            except OSError as err:
+                print(f"{job['filename']} is not moved: {err}")
+
+    def verified(job, error):
+        finished(job, verified=True, verify_error=error)
+
+    print(f"Watching {directory}")
+    number_of_loaded_xmls = 0
+    try:
+        # read, sign and upload files as they appear (for all the accounts at once)
+        for job in upload_files(accounts, new_files(), verified):
+            in_progress.discard(job['path'])
+            if job['error'] is None:
+                number_of_loaded_xmls += 1
+                print(f"Loaded: {job['filename']} ({number_of_loaded_xmls} since start)")
+                folder = 'done'
+            else:
+                title, error = error_description(job['error'])
+                print(title)
+                # if the file haven't been loaded successfully
+                report_error(job['filename'], error)
+                folder = 'failed'
+            finished(job, folder)
+    except KeyboardInterrupt:
+        print("Stopped")
+    finally:
+        for account in accounts:
+            account.tokens.stop()
+        # signatures which are verified in the background and the counters of the run
+        finish_run([account.session for account in accounts])
+
+
+
+
+if __name__ == "__main__":
+  
+    main()
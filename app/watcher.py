@@ -0,0 +1,103 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+
+IN_CLOSE_WRITE = 0x00000008   # file opened for writing was closed
+IN_MOVED_TO = 0x00000080   # file was renamed (moved) into the directory
+_EVENT_HEADER = struct.Struct('iIII')   # wd, mask, cookie, len (struct inotify_event)
+
+
+def _is_xml(name, extension):
+    return os.path.splitext(name)[1] == extension
+
+
+def _inotify(directory):
+    """
+    Returns inotify file descriptor watching the directory for written and renamed-in files
+    Raises OSError if inotify isn't available (not Linux)
+    """
+    name = ctypes.util.find_library('c')
+    libc = ctypes.CDLL(name, use_errno=True)
+    if not hasattr(libc, 'inotify_init1'):
+        raise OSError("inotify is not available")
+    fd = libc.inotify_init1(os.O_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    if libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        errno = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(errno, f"inotify_add_watch failed for {directory}")
+    return fd
+
+
+def _inotify_events(fd, directory, extension, stop):
+    """
+    Yields paths of files which have been closed after writing or renamed into the directory
+    """
+    while not (stop and stop.is_set()):
+        ready, _, _ = select.select([fd], [], [], 1.0)
+        if not ready:
+            continue
+        data = os.read(fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode()
+            offset += length
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and _is_xml(name, extension):
+                yield os.path.join(directory, name)
+
+
+def _poll(directory, extension, stop, interval, seen):
+    """
+    Scans the directory every "interval" seconds,
+    yields files whose size and modification time haven't changed since the previous scan
+    "seen" - the files yielded already, the ones which are no longer in the directory (moved away) are forgotten
+    """
+    previous = {}
+    while not (stop and stop.is_set()):
+        current = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and _is_xml(entry.name, extension):
+                    stat = entry.stat()
+                    current[entry.path] = (stat.st_size, stat.st_mtime)
+        for path, state in current.items():
+            if previous.get(path) == state and seen.get(path) != state:
+                seen[path] = state
+                yield path
+        for path in [path for path in seen if path not in current]:
+            del seen[path]
+        previous = current
+        time.sleep(interval)
+
+
+def watch_directory(directory, stop=None, poll_interval=2.0, extension='.xml'):
+    """
+    Yields paths of xml files which are already in the directory and then of the ones fully written into it:
+    closed after writing or renamed in (inotify), or with the same size and modification time
+    during two scans (polling, if inotify isn't available)
+    "stop" (threading.Event) ends the watching
+    """
+    try:
+        fd = _inotify(directory)
+    except OSError:
+        fd = None
+
+    if fd is None:
+        yield from _poll(directory, extension, stop, poll_interval, {})
+        return
+
+    # files written before the start (the watch is already set, so nothing is missed)
+    with os.scandir(directory) as entries:
+        existing = [entry.path for entry in entries if entry.is_file() and _is_xml(entry.name, extension)]
+    try:
+        yield from existing
+        yield from _inotify_events(fd, directory, extension, stop)
+    finally:
+        os.close(fd)